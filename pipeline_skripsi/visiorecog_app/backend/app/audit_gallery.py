@@ -0,0 +1,270 @@
+import argparse
+import heapq
+import json
+import pickle
+import time
+import numpy as np
+from pathlib import Path
+import config # Pastikan config.py ada di folder yang sama
+
+# --- Ambang Default ---
+# Cosine similarity >= nilai ini dianggap embedding duplikat (gambar yang sama/identik)
+DUPLICATE_SIMILARITY = 0.999
+# Pasangan beda subjek dengan similarity >= nilai ini dianggap mencurigakan.
+# (ArcFace: jarak cosine < 0.68 biasanya "orang sama", yaitu similarity > 0.32)
+CROSS_SUBJECT_SIMILARITY = 0.6
+# Sampel dengan similarity ke centroid subjeknya di bawah nilai ini dianggap outlier
+OUTLIER_SIMILARITY = 0.3
+
+
+def load_gallery(pkl_path: Path) -> (np.ndarray, np.ndarray, list, list):
+    """Memuat galeri: embedding ter-normalisasi (float32), kode label, nama subjek, dan path."""
+    with open(pkl_path, 'rb') as f:
+        features = pickle.load(f)['features']
+
+    embeddings = np.asarray([item['embedding'] for item in features], dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    embeddings /= np.maximum(norms, 1e-12)
+
+    subjects, codes = np.unique([item['subject_id'] for item in features], return_inverse=True)
+    paths = [item['image_path'] for item in features]
+    return embeddings, codes, [str(s) for s in subjects], paths
+
+
+def _find_roots(parent: np.ndarray, nodes: np.ndarray) -> np.ndarray:
+    """Akar union-find untuk banyak node sekaligus (parent[x] <= x, akar = indeks terkecil kelompok)."""
+    roots = parent[nodes]
+    while True:
+        parents = parent[roots]
+        if np.array_equal(parents, roots):
+            return roots
+        roots = parents
+
+
+def _union_pairs(parent: np.ndarray, rows: np.ndarray, cols: np.ndarray):
+    """Gabungkan semua pasangan (rows[k], cols[k]) secara tervektorisasi; akar besar menunjuk ke akar kecil."""
+    while len(rows):
+        root_a, root_b = _find_roots(parent, rows), _find_roots(parent, cols)
+        differ = root_a != root_b
+        if not differ.any():
+            return
+        rows, cols, root_a, root_b = rows[differ], cols[differ], root_a[differ], root_b[differ]
+        np.minimum.at(parent, np.maximum(root_a, root_b), np.minimum(root_a, root_b))
+
+
+def scan_pairs(embeddings: np.ndarray, codes: np.ndarray, block_size: int, duplicate_threshold: float, cross_threshold: float, max_pairs: int) -> (np.ndarray, list, int, list, int):
+    """
+    Menghitung similarity semua pasangan per blok (block_size x block_size) sehingga
+    memori tetap terbatas. Hanya segitiga atas yang dihitung. Pasangan duplikat tidak
+    disimpan semuanya: langsung digabung ke union-find berukuran n, hanya `max_pairs`
+    contoh pertama yang disimpan untuk laporan.
+    Mengembalikan (akar_kelompok_duplikat per gambar, contoh_duplikat, jumlah_duplikat,
+    pasangan_beda_subjek_terdekat, jumlah_beda_subjek).
+    """
+    n = len(embeddings)
+    parent = np.arange(n)
+    duplicate_examples = []
+    duplicate_total = 0
+    cross_heap = []  # min-heap (similarity, i, j) berisi pasangan paling mirip
+    cross_total = 0
+    n_blocks = (n + block_size - 1) // block_size
+    started = time.time()
+
+    for bi, i0 in enumerate(range(0, n, block_size)):
+        i1 = min(i0 + block_size, n)
+        block_i = embeddings[i0:i1]
+        codes_i = codes[i0:i1]
+        for j0 in range(i0, n, block_size):
+            j1 = min(j0 + block_size, n)
+            sims = block_i @ embeddings[j0:j1].T
+            if i0 == j0:
+                # Blok diagonal: abaikan pasangan dengan dirinya sendiri dan duplikat simetris
+                sims[np.tril_indices(i1 - i0, m=j1 - j0)] = -np.inf
+
+            rows, cols = np.nonzero(sims >= duplicate_threshold)
+            if len(rows):
+                duplicate_total += len(rows)
+                room = max_pairs - len(duplicate_examples)
+                if room > 0:
+                    duplicate_examples.extend(zip((rows[:room] + i0).tolist(), (cols[:room] + j0).tolist(),
+                                                  sims[rows[:room], cols[:room]].tolist()))
+                _union_pairs(parent, rows + i0, cols + j0)
+
+            cross_mask = (sims >= cross_threshold) & (codes_i[:, None] != codes[j0:j1][None, :])
+            rows, cols = np.nonzero(cross_mask)
+            cross_total += len(rows)
+            if max_pairs <= 0:
+                continue
+            if len(rows) > max_pairs:
+                # Hanya kandidat teratas blok ini yang mungkin masuk daftar akhir
+                top = np.argpartition(sims[rows, cols], -max_pairs)[-max_pairs:]
+                rows, cols = rows[top], cols[top]
+            for r, c, s in zip(rows.tolist(), cols.tolist(), sims[rows, cols].tolist()):
+                entry = (s, r + i0, c + j0)
+                if len(cross_heap) < max_pairs:
+                    heapq.heappush(cross_heap, entry)
+                elif entry > cross_heap[0]:
+                    heapq.heapreplace(cross_heap, entry)
+
+        print(f"  Blok {bi + 1}/{n_blocks} selesai ({time.time() - started:.1f} detik)")
+
+    cross_pairs = sorted(cross_heap, reverse=True)
+    return _find_roots(parent, np.arange(n)), duplicate_examples, duplicate_total, cross_pairs, cross_total
+
+
+def find_outliers(embeddings: np.ndarray, codes: np.ndarray, outlier_threshold: float, block_size: int = 2048) -> list:
+    """
+    Outlier intra-subjek: similarity tiap sampel ke centroid subjeknya sendiri
+    (leave-one-out) dibandingkan dengan centroid subjek lain yang paling dekat.
+    Dihitung per blok baris agar memori ~ block_size x jumlah_subjek, bukan n x jumlah_subjek.
+    """
+    n_subjects = codes.max() + 1 if len(codes) else 0
+    sums = np.zeros((n_subjects, embeddings.shape[1]), dtype=np.float64)
+    np.add.at(sums, codes, embeddings)
+    counts = np.bincount(codes, minlength=n_subjects)
+    centroids = (sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)).astype(np.float32)
+
+    outliers = []
+    for i0 in range(0, len(codes), block_size):
+        i1 = min(i0 + block_size, len(codes))
+        block, block_codes = embeddings[i0:i1], codes[i0:i1]
+        rows = np.arange(i1 - i0)
+
+        # Centroid subjek sendiri tanpa sampel itu sendiri
+        own_sum = sums[block_codes] - block
+        own_count = counts[block_codes] - 1
+        own_norm = np.linalg.norm(own_sum, axis=1)
+        own_sim = np.where(own_count > 0, np.einsum('ij,ij->i', own_sum, block) / np.maximum(own_norm, 1e-12), np.nan)
+
+        if n_subjects > 1:
+            other_sims = block @ centroids.T
+            other_sims[rows, block_codes] = -np.inf
+            nearest_other = np.argmax(other_sims, axis=1)
+            nearest_other_sim = other_sims[rows, nearest_other]
+        else:
+            nearest_other = np.full(len(rows), -1)
+            nearest_other_sim = np.full(len(rows), -np.inf)
+
+        for idx in np.nonzero((own_sim < outlier_threshold) | (nearest_other_sim > own_sim))[0].tolist():
+            outliers.append((idx + i0, float(own_sim[idx]), int(nearest_other[idx]), float(nearest_other_sim[idx])))
+    return sorted(outliers, key=lambda o: o[1])
+
+
+def duplicate_exclusions(duplicate_roots: np.ndarray, paths: list, codes: np.ndarray) -> (list, list):
+    """
+    Kelompok duplikat diberikan sebagai akar union-find per gambar (hasil scan_pairs).
+    Kelompok yang seluruh anggotanya dari subjek yang sama aman dibersihkan otomatis: satu
+    gambar (indeks terkecil) dipertahankan dan sisanya dikeluarkan. Kelompok yang mencampur
+    beberapa subjek berarti ada label yang salah, sehingga tidak dipilih otomatis dan
+    dikembalikan terpisah untuk diperiksa manual.
+    Mengembalikan (nama_file_dikeluarkan, kelompok_beda_subjek berupa list indeks).
+    """
+    duplicate_roots = np.asarray(duplicate_roots)
+    group_sizes = np.bincount(duplicate_roots, minlength=len(duplicate_roots))
+    groups = {}
+    for idx in np.nonzero(group_sizes[duplicate_roots] > 1)[0].tolist():
+        groups.setdefault(int(duplicate_roots[idx]), []).append(idx)
+
+    excluded, conflicts = [], []
+    for members in groups.values():
+        if len({int(codes[idx]) for idx in members}) > 1:
+            conflicts.append(members)
+        else:
+            excluded.extend(Path(paths[idx]).name for idx in members[1:])
+    return sorted(excluded), sorted(conflicts)
+
+
+def audit_gallery():
+    parser = argparse.ArgumentParser(description="Audit galeri: duplikat, pasangan beda subjek yang mirip, dan outlier.")
+    parser.add_argument('--block-size', type=int, default=2048, help="Ukuran blok perkalian matriks (memori ~ block_size^2 x 4 byte).")
+    parser.add_argument('--duplicate-threshold', type=float, default=DUPLICATE_SIMILARITY)
+    parser.add_argument('--cross-threshold', type=float, default=CROSS_SUBJECT_SIMILARITY)
+    parser.add_argument('--outlier-threshold', type=float, default=OUTLIER_SIMILARITY)
+    parser.add_argument('--max-pairs', type=int, default=50, help="Jumlah contoh pasangan (duplikat & beda subjek teratas) yang ditampilkan/disimpan.")
+    parser.add_argument('--report', type=Path, default=None, help="Simpan laporan lengkap ke file JSON.")
+    parser.add_argument('--exclude-duplicates', action='store_true',
+                        help=f"Tulis daftar duplikat subjek-sama ke {config.GALLERY_EXCLUDE_PATH.name} agar tidak dipakai server & train_models.py.")
+    parser.add_argument('--exclude-conflicts', action='store_true',
+                        help="Bersama --exclude-duplicates: keluarkan juga SEMUA anggota kelompok duplikat beda subjek.")
+    args = parser.parse_args()
+    if args.block_size <= 0:
+        parser.error("--block-size harus lebih besar dari 0.")
+    if args.max_pairs < 0:
+        parser.error("--max-pairs tidak boleh negatif.")
+
+    print("--- AUDIT GALERI ---")
+    pkl_path = config.GALLERY_CACHE_PATH
+    if not pkl_path.exists():
+        print("File gallery_features.pkl tidak ditemukan!")
+        print("Jalankan server (main.py) setidaknya satu kali untuk membangun galeri.")
+        return
+
+    embeddings, codes, subjects, paths = load_gallery(pkl_path)
+    print(f"Total wajah di database: {len(embeddings)} ({len(subjects)} subjek)")
+    if len(embeddings) < 2:
+        print("Data galeri terlalu sedikit untuk diaudit.")
+        return
+
+    started = time.time()
+    duplicate_roots, duplicates, duplicate_total, cross_pairs, cross_total = scan_pairs(
+        embeddings, codes, args.block_size, args.duplicate_threshold, args.cross_threshold, args.max_pairs)
+    outliers = find_outliers(embeddings, codes, args.outlier_threshold, args.block_size)
+    print(f"Audit selesai dalam {time.time() - started:.1f} detik.")
+
+    name = lambda idx: Path(paths[idx]).name
+
+    print(f"\n--- DUPLIKAT (similarity >= {args.duplicate_threshold}) : {duplicate_total} pasangan ---")
+    for i, j, sim in duplicates:
+        flag = "" if codes[i] == codes[j] else "  <-- BEDA SUBJEK (CRITICAL)"
+        print(f"{name(i)} ({subjects[codes[i]]}) == {name(j)} ({subjects[codes[j]]}) | sim={sim:.5f}{flag}")
+
+    print(f"\n--- PASANGAN BEDA SUBJEK MENCURIGAKAN (similarity >= {args.cross_threshold}) : {cross_total} pasangan ---")
+    for sim, i, j in cross_pairs:
+        print(f"{name(i)} ({subjects[codes[i]]}) ~ {name(j)} ({subjects[codes[j]]}) | sim={sim:.4f}")
+
+    print(f"\n--- OUTLIER INTRA-SUBJEK : {len(outliers)} sampel ---")
+    for idx, own_sim, other, other_sim in outliers[:args.max_pairs]:
+        other_label = subjects[other] if other >= 0 else "-"
+        print(f"{name(idx)} ({subjects[codes[idx]]}) | sim ke subjek sendiri={own_sim:.4f} | "
+              f"subjek lain terdekat={other_label} ({other_sim:.4f})")
+
+    excluded, conflicts = duplicate_exclusions(duplicate_roots, paths, codes)
+    print(f"\n--- KELOMPOK DUPLIKAT BEDA SUBJEK (periksa label manual) : {len(conflicts)} kelompok ---")
+    for members in conflicts[:args.max_pairs]:
+        print(" == ".join(f"{name(idx)} ({subjects[codes[idx]]})" for idx in members))
+
+    if args.exclude_duplicates:
+        conflict_names = sorted(name(idx) for members in conflicts for idx in members) if args.exclude_conflicts else []
+        with open(config.GALLERY_EXCLUDE_PATH, 'w') as f:
+            json.dump({'excluded': sorted(excluded + conflict_names),
+                       'reason': 'duplicate+conflict' if conflict_names else 'duplicate',
+                       'duplicate_threshold': args.duplicate_threshold}, f, indent=2)
+        print(f"\n{len(excluded)} gambar duplikat subjek-sama ditulis ke {config.GALLERY_EXCLUDE_PATH}")
+        if conflict_names:
+            print(f"{len(conflict_names)} gambar dari kelompok beda subjek ikut dikeluarkan (--exclude-conflicts).")
+        elif conflicts:
+            print(f"{len(conflicts)} kelompok beda subjek TIDAK dikeluarkan; perbaiki labelnya atau pakai --exclude-conflicts.")
+        print("Jalankan ulang train_models.py dan restart server agar galeri bersih dipakai.")
+
+    if args.report:
+        report = {
+            'total_images': len(embeddings),
+            'total_subjects': len(subjects),
+            'duplicate_total': duplicate_total,
+            'duplicate_examples': [{'a': name(i), 'b': name(j), 'similarity': sim} for i, j, sim in duplicates],
+            'cross_subject_total': cross_total,
+            'cross_subject_pairs': [{'a': name(i), 'subject_a': subjects[codes[i]], 'b': name(j),
+                                     'subject_b': subjects[codes[j]], 'similarity': sim} for sim, i, j in cross_pairs],
+            'outliers': [{'image': name(idx), 'subject': subjects[codes[idx]], 'own_similarity': own_sim,
+                          'nearest_other_subject': subjects[other] if other >= 0 else None,
+                          'nearest_other_similarity': other_sim} for idx, own_sim, other, other_sim in outliers],
+            'duplicate_exclusions': excluded,
+            'cross_subject_duplicate_groups': [[{'image': name(idx), 'subject': subjects[codes[idx]]} for idx in members]
+                                               for members in conflicts],
+        }
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2, default=str)
+        print(f"Laporan lengkap disimpan di {args.report}")
+
+if __name__ == "__main__":
+    audit_gallery()
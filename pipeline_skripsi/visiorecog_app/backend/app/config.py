@@ -25,3 +25,93 @@ GALLERY_CACHE_PATH = MODELS_DIR / 'gallery_features.pkl'
 
 # --- Model Machine Learning ---
 DEEPFACE_MODEL_NAME = "ArcFace"
+
+# Versi jalur crop + embedding. Ikut masuk ke hash cache galeri, jadi ubah nilai ini
+# setiap kali cara wajah di-crop/di-align/di-embed berubah agar gallery_features.pkl dibangun ulang.
+# PENTING: nilai ini hanya membangun ulang cache galeri. Model KNN/SVM di models/ dan
+# models_evaluation/ serta embedding dari notebook ekstraksi memakai jalur yang sama
+# (RetinaFace + align DeepFace); jika jalur berubah, train_models.py dan notebook ekstraksi
+# juga harus dijalankan ulang.
+EMBEDDING_VERSION = "retinaface-deepface-align|arcface-skip"
+
+# --- Deteksi Wajah ---
+# Deteksi gambar asli dipakai ulang untuk gambar hasil restorasi hanya jika:
+# 1. kepercayaan RetinaFace pada gambar asli >= REUSE_DETECTION_MIN_CONFIDENCE,
+# 2. ukuran gambar sama (selalu benar untuk output restore_face; hanya pengaman), dan
+# 3. embedding wajah restorasi (dari crop yang dipakai ulang) memiliki cosine similarity
+#    >= REUSE_DETECTION_MIN_SIMILARITY terhadap embedding wajah asli. Ini cek pada gambar
+#    restorasi itu sendiri: crop yang meleset/rusak menghasilkan embedding yang jauh.
+# Jika salah satu gagal, RetinaFace dijalankan ulang pada gambar restorasi.
+REUSE_DETECTION_MIN_CONFIDENCE = 0.9
+REUSE_DETECTION_MIN_SIMILARITY = 0.3
+
+# --- Mode Probe Video ---
+# Hanya setiap frame ke-N yang diambil (retrieve) dan dideteksi. Frame lain tetap di-decode
+# oleh codec antar-frame, jadi stride tidak mengurangi biaya decode.
+VIDEO_FRAME_STRIDE = 5
+# Batas jumlah frame yang disampel per klip (0 = tanpa batas)
+VIDEO_MAX_SAMPLED_FRAMES = 0
+# Deteksi dengan kepercayaan di bawah ini diabaikan
+VIDEO_MIN_DETECTION_CONFIDENCE = 0.9
+# IoU minimum agar deteksi dianggap wajah yang sama dengan track sebelumnya
+VIDEO_TRACK_IOU_THRESHOLD = 0.3
+# Jumlah frame sampel berturut-turut tanpa deteksi sebelum track ditutup
+VIDEO_TRACK_MAX_MISSED = 3
+# Track dengan deteksi lebih sedikit dari ini dianggap noise
+VIDEO_MIN_TRACK_HITS = 2
+# Jumlah keyframe terbaik (BRISQUE + NIQE) yang direstorasi & di-embed per track
+VIDEO_KEYFRAMES_PER_TRACK = 3
+# Margin crop wajah relatif terhadap ukuran kotak deteksi
+VIDEO_CROP_MARGIN = 0.25
+# Crop wajah diubah ke ukuran persegi ini sebelum dinilai BRISQUE/NIQE, agar semua wajah
+# dalam satu frame dinilai dalam satu batch dan skornya sebanding antar track
+VIDEO_IQA_SIZE = 256
+
+# --- Worker Inferensi (Multi-Proses) ---
+# Jumlah proses worker inferensi. 0 = pipeline dijalankan di proses server (mode lama).
+# Embedding galeri, KNN, GFPGAN, dan BRISQUE/NIQE dimuat sekali dan dipakai bersama, tetapi
+# setiap worker tetap memuat TensorFlow + ArcFace + RetinaFace (DeepFace) dan SVM sendiri:
+# perkirakan tambahan ~0,5-1 GB RAM per worker.
+INFERENCE_WORKERS = 0
+# Ukuran satu slot gambar di shared memory (cukup untuk gambar BGR 2048x2048).
+# Gambar yang lebih besar memakai segmen sementara tersendiri.
+WORKER_SLOT_BYTES = 2048 * 2048 * 3
+# Jumlah slot gambar per worker (request yang sedang diproses + antrean)
+WORKER_SLOTS_PER_WORKER = 2
+# Batas waktu (detik) menunggu hasil satu tugas. Jika terlewati, worker yang memegang
+# tugas tersebut dihentikan dan dijalankan ulang; tugas lain di worker itu ikut gagal.
+WORKER_TASK_TIMEOUT = 120
+WORKER_VIDEO_TASK_TIMEOUT = 900
+# Interval (detik) pemeriksaan worker yang mati
+WORKER_MONITOR_INTERVAL = 1.0
+# File kunci agar hanya satu proses server yang memiliki pool worker
+# (mis. mencegah `uvicorn --workers N` memuat N pool sekaligus)
+WORKER_POOL_LOCK_PATH = MODELS_DIR / 'inference_pool.lock'
+
+# Daftar gambar galeri yang dikeluarkan (mis. duplikat hasil audit_gallery.py --exclude-duplicates).
+# Gambar di daftar ini tidak dipakai untuk pencarian maupun train_models.py.
+GALLERY_EXCLUDE_PATH = MODELS_DIR / 'gallery_exclude.json'
+
+# Sisi terpanjang gambar saat deteksi RetinaFace. Gambar yang lebih besar diperkecil dulu
+# (piramida: naik 2x jika tidak ada wajah), sehingga biaya deteksi tidak bergantung resolusi.
+# 0 = selalu deteksi pada resolusi penuh.
+DETECTION_MAX_SIDE = 640
+# Jumlah level piramida (640, 1280, ...). Gambar yang lebih besar dari level terakhir tidak
+# pernah dideteksi pada resolusi penuh; jika tidak ada wajah, hasilnya kosong.
+# Wajah dari level yang diperkecil di-crop dengan FaceDetection.crop_aligned (bukan align
+# DeepFace); galeri selalu dideteksi pada resolusi penuh.
+DETECTION_PYRAMID_LEVELS = 2
+
+# --- Penilaian Kualitas Gambar (BRISQUE & NIQE) ---
+# Gambar dengan sisi terpanjang melebihi nilai ini diperkecil sebelum dinilai (0 = tanpa batas).
+# BRISQUE/NIQE tidak invarian terhadap skala: nilai > 0 mengubah skor gambar besar sehingga
+# tidak sebanding lagi dengan hasil evaluasi sebelumnya. Default 0 mempertahankan skor lama.
+IQA_MAX_SIDE = 0
+# True: IQA hanya dihitung pada area wajah yang terdeteksi, bukan seluruh gambar
+IQA_ON_FACE_CROP = False
+
+# --- Plot Embedding Galeri ---
+# Batas titik untuk /embedding-plot?lod=auto sebelum beralih ke agregat per subjek
+EMBEDDING_PLOT_MAX_POINTS = 5000
+# Jumlah desimal koordinat pada format=columnar
+EMBEDDING_PLOT_DECIMALS = 3
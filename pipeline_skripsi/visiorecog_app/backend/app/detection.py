@@ -0,0 +1,78 @@
+import cv2
+import numpy as np
+
+# Impor dari modul lokal kita
+from . import config
+
+
+class FaceDetection:
+    """
+    Hasil deteksi satu wajah: kotak, lima landmark, dan transformasi alignment.
+    Objek ini bisa dibawa dari gambar asli ke gambar hasil restorasi (geometri sama),
+    sehingga RetinaFace tidak perlu dijalankan dua kali.
+    """
+    def __init__(self, facial_area: dict, confidence: float, face: np.ndarray = None):
+        self.facial_area = facial_area
+        self.confidence = confidence
+        # Wajah ter-crop & ter-align (RGB, float 0-1): dari DeepFace, atau dari crop_aligned()
+        # untuk deteksi yang dipetakan balik dari piramida
+        self.face = face
+        self.image_size = (facial_area['image_width'], facial_area['image_height'])
+        self.crop_size = (max(1, int(facial_area['w'])), max(1, int(facial_area['h'])))
+        self.transform = self._compute_alignment_transform()
+
+    def _compute_alignment_transform(self) -> np.ndarray:
+        """Matriks affine 2x3: putar agar kedua mata sejajar, lalu geser ke origin crop."""
+        area = self.facial_area
+        center = (area['x'] + area['w'] / 2.0, area['y'] + area['h'] / 2.0)
+        angle = 0.0
+        left_eye, right_eye = area.get('left_eye'), area.get('right_eye')
+        if left_eye is not None and right_eye is not None:
+            # Urutkan berdasarkan sumbu x agar tidak bergantung konvensi kiri/kanan DeepFace
+            (x1, y1), (x2, y2) = sorted([tuple(left_eye), tuple(right_eye)])
+            angle = float(np.degrees(np.arctan2(y2 - y1, x2 - x1)))
+
+        matrix = cv2.getRotationMatrix2D(center, angle, 1.0)
+        matrix[0, 2] += self.crop_size[0] / 2.0 - center[0]
+        matrix[1, 2] += self.crop_size[1] / 2.0 - center[1]
+        return matrix
+
+    def is_reusable_for(self, image_array: np.ndarray) -> bool:
+        """Cek awal (sebelum embedding): deteksi cukup yakin dan ukuran gambar target sama."""
+        height, width = image_array.shape[:2]
+        return (self.confidence >= config.REUSE_DETECTION_MIN_CONFIDENCE
+                and (width, height) == self.image_size)
+
+    def crop_aligned(self, image_array: np.ndarray) -> np.ndarray:
+        """Crop & align wajah dari gambar (BGR) dengan format seperti output DeepFace (RGB, 0-1)."""
+        face_bgr = cv2.warpAffine(image_array, self.transform, self.crop_size, flags=cv2.INTER_LINEAR)
+        return face_bgr[:, :, ::-1].astype(np.float32) / 255.0
+
+    def landmarks(self) -> dict:
+        """Salinan facial_area untuk dikirim ke frontend."""
+        return dict(self.facial_area)
+
+    def box(self) -> tuple:
+        """Kotak wajah sebagai (x1, y1, x2, y2)."""
+        area = self.facial_area
+        return (area['x'], area['y'], area['x'] + area['w'], area['y'] + area['h'])
+
+    def rebase(self, offset: tuple, scale: float, image_size: tuple) -> 'FaceDetection':
+        """
+        Memindahkan deteksi ke sistem koordinat lain: geser sebesar `offset` (x, y)
+        lalu skala dengan `scale`. Dipakai saat wajah dari sebuah frame di-crop
+        dan diperbesar, sehingga tidak perlu deteksi ulang pada crop tersebut.
+        """
+        ox, oy = offset
+        area = {}
+        for key, value in self.facial_area.items():
+            if key in ('x', 'y'):
+                area[key] = int(round((value - (ox if key == 'x' else oy)) * scale))
+            elif key in ('w', 'h'):
+                area[key] = int(round(value * scale))
+            elif isinstance(value, (tuple, list)) and len(value) == 2:
+                area[key] = (int(round((value[0] - ox) * scale)), int(round((value[1] - oy) * scale)))
+            else:
+                area[key] = value
+        area['image_width'], area['image_height'] = image_size
+        return FaceDetection(area, self.confidence, face=self.face)
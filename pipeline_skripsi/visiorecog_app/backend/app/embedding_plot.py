@@ -0,0 +1,134 @@
+import hashlib
+
+import numpy as np
+
+# Impor dari modul lokal kita
+from . import config
+
+LOD_CHOICES = ('auto', 'subjects', 'points')
+FORMAT_CHOICES = ('json', 'columnar')
+
+
+class EmbeddingPlotIndex:
+    """
+    Indeks koordinat t-SNE galeri untuk endpoint /embedding-plot. Dibangun sekali per
+    versi galeri, lalu menjawab query viewport dan level-of-detail tanpa menyalin
+    seluruh data: agregat per subjek untuk zoom jauh, sampel titik untuk zoom dekat.
+    """
+    def __init__(self, tsne_results: dict, version: str):
+        self.version = version
+        self.x = np.asarray(tsne_results['x'], dtype=np.float64)
+        self.y = np.asarray(tsne_results['y'], dtype=np.float64)
+        subjects, self.codes = np.unique(np.asarray(tsne_results['labels'], dtype=str), return_inverse=True)
+        self.subjects = [str(s) for s in subjects]
+        self.total_points = len(self.x)
+        # t-SNE dihitung ulang setiap startup dan hasilnya bisa berbeda walau galerinya sama,
+        # jadi ETag memakai versi galeri + hash koordinat hasil proyeksi
+        projection_hash = hashlib.sha256(self.x.tobytes() + self.y.tobytes()).hexdigest()[:16]
+        self.etag = f"{version}-{projection_hash}"
+
+        # Prioritas sampling: urutan acak (tetap) di dalam tiap subjek, lalu round-robin antar
+        # subjek, sehingga sampel kecil pun memuat semua subjek dan titik tidak "meloncat" saat zoom.
+        rng = np.random.default_rng(42)
+        shuffled = rng.permutation(self.total_points)
+        rank_in_subject = np.empty(self.total_points, dtype=np.int64)
+        seen = np.zeros(len(self.subjects), dtype=np.int64)
+        for index in shuffled:
+            code = self.codes[index]
+            rank_in_subject[index] = seen[code]
+            seen[code] += 1
+        self.priority = np.empty(self.total_points, dtype=np.int64)
+        self.priority[np.lexsort((np.argsort(shuffled), rank_in_subject))] = np.arange(self.total_points)
+
+        # Agregat per subjek: centroid, jumlah titik, dan sebaran
+        counts = np.bincount(self.codes, minlength=len(self.subjects))
+        safe_counts = np.maximum(counts, 1)
+        self.subject_counts = counts
+        self.subject_x = np.bincount(self.codes, weights=self.x, minlength=len(self.subjects)) / safe_counts
+        self.subject_y = np.bincount(self.codes, weights=self.y, minlength=len(self.subjects)) / safe_counts
+        var_x = np.bincount(self.codes, weights=self.x ** 2, minlength=len(self.subjects)) / safe_counts - self.subject_x ** 2
+        var_y = np.bincount(self.codes, weights=self.y ** 2, minlength=len(self.subjects)) / safe_counts - self.subject_y ** 2
+        self.subject_spread = np.sqrt(np.maximum(var_x + var_y, 0.0))
+
+    @staticmethod
+    def _in_viewport(x: np.ndarray, y: np.ndarray, bounds: tuple) -> np.ndarray:
+        x_min, x_max, y_min, y_max = bounds
+        mask = np.ones(len(x), dtype=bool)
+        if x_min is not None: mask &= x >= x_min
+        if x_max is not None: mask &= x <= x_max
+        if y_min is not None: mask &= y >= y_min
+        if y_max is not None: mask &= y <= y_max
+        return mask
+
+    def query(self, lod: str = 'points', bounds: tuple = (None, None, None, None), max_points: int = None, fmt: str = 'json') -> dict:
+        """
+        lod='points'  : titik di dalam viewport, disampel hingga `max_points` (None = semua).
+        lod='subjects': satu titik agregat per subjek yang centroid-nya di dalam viewport.
+        lod='auto'    : agregat subjek untuk tampilan penuh galeri besar, titik jika sudah di-zoom
+                        atau jumlah titiknya muat dalam batas.
+        fmt='columnar': label di-encode sebagai indeks ke daftar `subjects` dan koordinat dibulatkan
+                        (untuk kedua lod).
+        """
+        zoomed = any(value is not None for value in bounds)
+        point_mask = self._in_viewport(self.x, self.y, bounds)
+        points_in_view = int(point_mask.sum())
+
+        if lod == 'auto':
+            limit = max_points or config.EMBEDDING_PLOT_MAX_POINTS
+            lod = 'points' if (zoomed or points_in_view <= limit) else 'subjects'
+            max_points = limit
+
+        meta = {
+            'lod': lod,
+            'version': self.version,
+            'total_points': self.total_points,
+            'points_in_view': points_in_view,
+        }
+        if lod == 'subjects':
+            return {**meta, **self._subjects_payload(bounds, fmt)}
+        return {**meta, **self._points_payload(point_mask, max_points, fmt)}
+
+    def _points_payload(self, mask: np.ndarray, max_points: int, fmt: str) -> dict:
+        indices = np.nonzero(mask)[0]
+        if max_points is not None and len(indices) > max_points:
+            indices = np.sort(indices[np.argsort(self.priority[indices])[:max_points]])
+
+        x, y, codes = self.x[indices], self.y[indices], self.codes[indices]
+        if fmt == 'columnar':
+            decimals = config.EMBEDDING_PLOT_DECIMALS
+            return {
+                'returned_points': len(indices),
+                'subjects': self.subjects,
+                'label_index': codes.tolist(),
+                'x': np.round(x, decimals).tolist(),
+                'y': np.round(y, decimals).tolist(),
+            }
+        return {
+            'returned_points': len(indices),
+            'labels': [self.subjects[code] for code in codes.tolist()],
+            'x': x.tolist(),
+            'y': y.tolist(),
+        }
+
+    def _subjects_payload(self, bounds: tuple, fmt: str) -> dict:
+        mask = self._in_viewport(self.subject_x, self.subject_y, bounds) & (self.subject_counts > 0)
+        indices = np.nonzero(mask)[0]
+        if fmt == 'columnar':
+            decimals = config.EMBEDDING_PLOT_DECIMALS
+            return {
+                'returned_points': len(indices),
+                'subjects': self.subjects,
+                'label_index': indices.tolist(),
+                'x': np.round(self.subject_x[indices], decimals).tolist(),
+                'y': np.round(self.subject_y[indices], decimals).tolist(),
+                'count': self.subject_counts[indices].tolist(),
+                'spread': np.round(self.subject_spread[indices], decimals).tolist(),
+            }
+        return {
+            'returned_points': len(indices),
+            'labels': [self.subjects[i] for i in indices.tolist()],
+            'x': self.subject_x[indices].tolist(),
+            'y': self.subject_y[indices].tolist(),
+            'count': self.subject_counts[indices].tolist(),
+            'spread': self.subject_spread[indices].tolist(),
+        }
@@ -0,0 +1,22 @@
+import json
+from pathlib import Path
+
+# Modul ini sengaja tidak mengimpor config agar bisa dipakai bersama oleh paket app
+# (pipeline, workers) maupun skrip yang dijalankan langsung (train_models.py).
+
+
+def apply_gallery_exclusions(features: list, exclude_path: Path) -> list:
+    """Membuang gambar yang tercantum di `exclude_path` (hasil audit_gallery.py)."""
+    try:
+        with open(exclude_path, 'r') as f:
+            excluded = set(json.load(f).get('excluded', []))
+    except FileNotFoundError:
+        return features
+    except (json.JSONDecodeError, AttributeError):
+        print(f"PERINGATAN: File {exclude_path} rusak, diabaikan.")
+        return features
+
+    kept = [item for item in features if Path(item['image_path']).name not in excluded]
+    if len(kept) != len(features):
+        print(f"{len(features) - len(kept)} gambar galeri dikeluarkan sesuai {Path(exclude_path).name}.")
+    return kept
@@ -0,0 +1,47 @@
+import numpy as np
+
+
+class GalleryKNNClassifier:
+    """
+    Pengganti KNeighborsClassifier (metrik euclidean) untuk worker inferensi: tetangga dicari
+    langsung pada matriks embedding galeri bersama, sehingga setiap worker tidak perlu
+    menyimpan salinan data latih (_fit_X) dari knn_model.pkl. predict_proba() mengikuti
+    perilaku scikit-learn, termasuk bobot 'distance' dan penanganan jarak nol.
+    """
+    def __init__(self, embeddings: np.ndarray, label_codes: np.ndarray, n_classes: int, n_neighbors: int = 1, weights: str = 'distance'):
+        if weights not in ('uniform', 'distance'):
+            raise ValueError(f"weights tidak didukung: {weights}")
+        self.embeddings = embeddings  # Tidak disalin; boleh berupa view ke shared memory
+        self.label_codes = np.asarray(label_codes, dtype=np.int64)
+        self.n_classes = n_classes
+        self.n_neighbors = n_neighbors
+        self.weights = weights
+        # Baris dengan label yang tidak dikenal LabelEncoder (kode -1) tidak pernah dipilih
+        self._valid = self.label_codes >= 0
+        self._sq_norms = np.einsum('ij,ij->i', embeddings, embeddings, dtype=np.float64) if len(embeddings) else np.zeros(0)
+
+    def predict_proba(self, queries) -> np.ndarray:
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        probabilities = np.zeros((len(queries), self.n_classes), dtype=np.float64)
+        k = min(self.n_neighbors, int(self._valid.sum()))
+        if k == 0:
+            return probabilities
+
+        for row, query in enumerate(queries):
+            # ||g - q||^2 = ||g||^2 + ||q||^2 - 2 g.q, dalam satu perkalian matriks-vektor
+            sq_dist = self._sq_norms + float(query @ query) - 2.0 * (self.embeddings @ query)
+            distances = np.sqrt(np.maximum(sq_dist, 0.0))
+            distances[~self._valid] = np.inf
+            nearest = np.argpartition(distances, k - 1)[:k]
+
+            if self.weights == 'distance':
+                with np.errstate(divide='ignore'):
+                    weights = 1.0 / distances[nearest]
+                if np.isinf(weights).any():
+                    # Seperti scikit-learn: tetangga berjarak nol mendapat seluruh bobot
+                    weights = np.isinf(weights).astype(np.float64)
+            else:
+                weights = np.ones(k)
+            np.add.at(probabilities[row], self.label_codes[nearest], weights)
+            probabilities[row] /= probabilities[row].sum()
+        return probabilities
@@ -0,0 +1,92 @@
+import cv2
+import numpy as np
+import torch
+from typing import Union
+
+# Impor dari modul lokal kita
+from . import config
+
+try:
+    import pyiqa
+except ImportError as e:
+    print(f"Error: Pustaka pyiqa tidak terinstal. {e}")
+    print("Silakan jalankan 'pip install -r requirements.txt' di terminal Anda.")
+    raise
+
+
+class IQAEngine:
+    """
+    Penilaian kualitas gambar (BRISQUE & NIQE) dengan preprocessing bersama:
+    konversi RGB, pembatasan ukuran, dan transfer ke device hanya dilakukan sekali
+    untuk semua metrik. Mendukung batch gambar dan crop wajah.
+    """
+    METRICS = ('brisque', 'niqe')
+
+    def __init__(self, device: torch.device, max_side: int = config.IQA_MAX_SIDE):
+        self.device = device
+        self.max_side = max_side
+        self.assessors = {name: pyiqa.create_metric(name, device=self.device) for name in self.METRICS}
+
+    def _preprocess(self, image_array: np.ndarray, box: tuple = None, common_size: int = None) -> Union[np.ndarray, None]:
+        """
+        Crop (opsional), batasi sisi terpanjang (atau ubah ke persegi `common_size`),
+        lalu ubah ke RGB float32 0-1 (HWC).
+        """
+        if image_array is None or image_array.size == 0:
+            return None
+        if box is not None:
+            height, width = image_array.shape[:2]
+            x1, y1, x2, y2 = (int(v) for v in box)
+            image_array = image_array[max(0, y1):min(height, y2), max(0, x1):min(width, x2)]
+            if image_array.size == 0:
+                return None
+
+        height, width = image_array.shape[:2]
+        longest_side = max(height, width)
+        if common_size:
+            interpolation = cv2.INTER_AREA if longest_side > common_size else cv2.INTER_CUBIC
+            image_array = cv2.resize(image_array, (common_size, common_size), interpolation=interpolation)
+        elif self.max_side and longest_side > self.max_side:
+            scale = self.max_side / longest_side
+            image_array = cv2.resize(image_array, (max(1, round(width * scale)), max(1, round(height * scale))), interpolation=cv2.INTER_AREA)
+
+        img_rgb = cv2.cvtColor(image_array, cv2.COLOR_BGR2RGB)
+        return img_rgb.astype(np.float32) / 255.0
+
+    def score(self, image_array: np.ndarray, box: tuple = None, metrics: tuple = METRICS) -> Union[dict, None]:
+        """Skor satu gambar (BGR). `box` (x1, y1, x2, y2) membatasi penilaian ke area wajah."""
+        return self.score_batch([image_array], boxes=[box], metrics=metrics)[0]
+
+    def score_batch(self, images: list, boxes: list = None, metrics: tuple = METRICS, common_size: int = None) -> list:
+        """
+        Skor banyak gambar sekaligus. Hanya gambar dengan ukuran sama (setelah
+        preprocessing) yang bisa digabung menjadi satu tensor; tanpa `common_size`, gambar
+        berbeda ukuran dinilai per kelompok ukuran dan skornya identik dengan score().
+        Dengan `common_size`, setiap gambar diubah ke persegi common_size x common_size
+        sehingga seluruhnya menjadi satu batch (skor sedikit berubah karena resize; cocok
+        untuk membandingkan crop wajah satu sama lain). Metrik yang tidak diminta
+        (mis. NIQE) tidak dijalankan. Hasil None untuk gambar yang gagal dinilai.
+        """
+        boxes = boxes or [None] * len(images)
+        results = [None] * len(images)
+
+        groups = {}
+        for index, (image_array, box) in enumerate(zip(images, boxes)):
+            prepared = self._preprocess(image_array, box, common_size)
+            if prepared is not None:
+                groups.setdefault(prepared.shape, []).append((index, prepared))
+
+        for members in groups.values():
+            indices = [index for index, _ in members]
+            try:
+                batch = torch.from_numpy(np.stack([prepared for _, prepared in members])).permute(0, 3, 1, 2)
+                batch = batch.to(self.device)
+                scores = {}
+                with torch.no_grad():
+                    for name in metrics:
+                        scores[name] = self.assessors[name](batch).flatten().tolist()
+                for position, index in enumerate(indices):
+                    results[index] = {name: round(values[position], 2) for name, values in scores.items()}
+            except Exception as e:
+                print(f"Gagal menghitung IQA untuk {len(indices)} gambar: {e}")
+        return results
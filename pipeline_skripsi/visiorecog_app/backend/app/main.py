@@ -1,14 +1,22 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import FastAPI, File, UploadFile, HTTPException, Request, Response, Query
 from fastapi.responses import JSONResponse
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware # Impor CORS Middleware
+from fastapi.concurrency import run_in_threadpool
+import os
 import shutil
 from pathlib import Path
 import uuid
+import cv2
+import numpy as np
 
 # Impor dari modul lokal kita
 from . import config
 from .pipeline import FaceRecognitionPipeline
+from .video import VideoProbeProcessor
+from .workers import InferenceWorkerPool, WorkerCrashedError, WorkerTimeoutError
+from .embedding_plot import EmbeddingPlotIndex, LOD_CHOICES, FORMAT_CHOICES
 
 # Inisialisasi aplikasi FastAPI
 app = FastAPI(
@@ -30,7 +38,10 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"], # Mengizinkan semua metode (GET, POST, dll)
     allow_headers=["*"], # Mengizinkan semua header
+    expose_headers=["ETag"], # Agar frontend bisa membaca ETag untuk If-None-Match
 )
+# Kompres respons besar (mis. data plot galeri)
+app.add_middleware(GZipMiddleware, minimum_size=1024)
 
 # --- Mount Direktori Static ---
 config.UPLOADS_DIR.mkdir(exist_ok=True)
@@ -38,20 +49,53 @@ app.mount("/uploads", StaticFiles(directory=config.UPLOADS_DIR), name="uploads")
 app.mount("/gallery", StaticFiles(directory=config.GALLERY_DIR), name="gallery")
 
 # --- Inisialisasi Pipeline ---
-try:
-    pipeline = FaceRecognitionPipeline()
-except Exception as e:
-    print(f"FATAL: Gagal menginisialisasi pipeline: {e}")
-    pipeline = None
+# Jika INFERENCE_WORKERS > 0, model dimuat di proses worker terpisah dan server ini
+# hanya menjadi front-end HTTP; pool dibuat di startup_event, bukan saat modul di-import.
+# Jika 0, pipeline dijalankan di proses ini (mode lama).
+pipeline = None
+video_processor = None
+worker_pool = None
+if config.INFERENCE_WORKERS <= 0:
+    try:
+        pipeline = FaceRecognitionPipeline()
+        video_processor = VideoProbeProcessor(pipeline)
+    except Exception as e:
+        print(f"FATAL: Gagal menginisialisasi pipeline: {e}")
+        pipeline = None
+        video_processor = None
 
 # --- API Endpoints ---
 
 @app.on_event("startup")
 async def startup_event():
-    if pipeline is None:
+    global worker_pool
+    if config.INFERENCE_WORKERS > 0:
+        if int(os.environ.get('WEB_CONCURRENCY', '1') or 1) > 1:
+            # Setiap proses server akan membuat pool sendiri; hanya satu yang mendapat kunci
+            print("PERINGATAN: INFERENCE_WORKERS > 0 sebaiknya dijalankan dengan satu proses uvicorn.")
+        try:
+            worker_pool = InferenceWorkerPool(config.INFERENCE_WORKERS)
+        except Exception as e:
+            print(f"FATAL: Gagal menginisialisasi pool worker: {e}")
+            worker_pool = None
+    if pipeline is None and worker_pool is None:
         raise RuntimeError("Aplikasi tidak dapat dimulai karena pipeline gagal dimuat. Periksa error di atas.")
     print("Aplikasi FastAPI berhasil dimulai. Kunjungi /docs untuk dokumentasi.")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    if worker_pool is not None:
+        worker_pool.shutdown()
+
+async def _call_worker(task_name: str, image: np.ndarray = None, *args, timeout: float = None):
+    """Jalankan tugas di pool worker tanpa memblokir event loop; kegagalan worker menjadi 503/504."""
+    try:
+        return await run_in_threadpool(worker_pool.call, task_name, image, *args, timeout=timeout)
+    except WorkerTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except WorkerCrashedError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
 @app.post("/recognize")
 async def recognize_face(
     image: UploadFile = File(..., description="File gambar wajah yang sudah di-crop")
@@ -68,12 +112,55 @@ async def recognize_face(
         image.file.close()
 
     print(f"Memproses file: {temp_path}")
-    results = pipeline.run_pipeline(temp_path)
+    if worker_pool is not None:
+        # Front-end hanya men-decode; piksel dikirim ke worker lewat shared memory
+        img_probe = cv2.imdecode(np.fromfile(str(temp_path), np.uint8), cv2.IMREAD_COLOR)
+        if img_probe is None:
+            results = {"error": "Gagal membaca file gambar."}
+        else:
+            results = await _call_worker('recognize', img_probe)
+    else:
+        results = pipeline.run_pipeline(temp_path)
 
     results['original_image_url'] = f"/uploads/{temp_filename}"
 
     return JSONResponse(content=results)
 
+@app.post("/recognize-video")
+async def recognize_video(
+    video: UploadFile = File(..., description="Klip video (mis. rekaman CCTV)")
+):
+    """
+    Mode probe video: wajah dilacak antar frame, dan restorasi/embedding hanya
+    dijalankan pada keyframe terbaik tiap track. Prediksi diagregasi per track.
+    """
+    if not video_processor and not worker_pool:
+        raise HTTPException(status_code=503, detail="Pipeline tidak tersedia.")
+
+    temp_filename = f"{uuid.uuid4()}{Path(video.filename).suffix}"
+    temp_path = config.UPLOADS_DIR / temp_filename
+
+    try:
+        with temp_path.open("wb") as buffer:
+            shutil.copyfileobj(video.file, buffer)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Gagal menyimpan file: {e}")
+    finally:
+        video.file.close()
+
+    print(f"Memproses video: {temp_path}")
+    try:
+        if worker_pool is not None:
+            results = await _call_worker('video', None, temp_path, timeout=config.WORKER_VIDEO_TASK_TIMEOUT)
+        else:
+            # Klip bisa diproses lama; jalankan di thread agar event loop tetap melayani request lain
+            results = await run_in_threadpool(video_processor.process, temp_path)
+    finally:
+        # Klip video bisa besar, jadi tidak disimpan setelah diproses
+        temp_path.unlink(missing_ok=True)
+
+    return JSONResponse(content=results)
+
 @app.post("/evaluate")
 async def evaluate_dataset(
     json_file: UploadFile = File(..., description="File JSON hasil pemrosesan dataset")
@@ -82,13 +169,18 @@ async def evaluate_dataset(
     Menerima file JSON yang berisi embedding dan ground truth,
     kemudian menjalankan evaluasi performa model secara menyeluruh.
     """
-    if not pipeline:
+    if not pipeline and not worker_pool:
         raise HTTPException(status_code=503, detail="Pipeline tidak tersedia.")
 
     try:
         content = await json_file.read()
-        evaluation_results = pipeline.run_evaluation(content)
+        if worker_pool is not None:
+            evaluation_results = await _call_worker('evaluate', None, content)
+        else:
+            evaluation_results = pipeline.run_evaluation(content)
         return JSONResponse(content=evaluation_results)
+    except HTTPException:
+        raise
     except Exception as e:
         # Memberikan error yang lebih spesifik jika terjadi masalah
         print(f"Error saat evaluasi: {e}")
@@ -96,12 +188,70 @@ async def evaluate_dataset(
     finally:
         await json_file.close()
 
+_plot_index = None
+_plot_source = None
+
+def _get_plot_index():
+    """Indeks plot dibangun sekali per versi galeri dan hasil t-SNE."""
+    global _plot_index, _plot_source
+    source = worker_pool or pipeline
+    if source is None or not source.tsne_results:
+        return None
+    if _plot_index is None or _plot_index.version != source.gallery_version or _plot_source is not source.tsne_results:
+        _plot_index = EmbeddingPlotIndex(source.tsne_results, source.gallery_version)
+        _plot_source = source.tsne_results
+    return _plot_index
+
 @app.get("/embedding-plot")
-async def get_embedding_plot_data():
-    """Endpoint untuk mendapatkan data plot t-SNE dari galeri."""
-    if pipeline and pipeline.tsne_results:
-        return JSONResponse(content=pipeline.tsne_results)
-    raise HTTPException(status_code=500, detail="Data plot tidak tersedia.")
+async def get_embedding_plot_data(
+    request: Request,
+    lod: str = 'points',
+    response_format: str = Query('json', alias='format'),
+    x_min: float = None,
+    x_max: float = None,
+    y_min: float = None,
+    y_max: float = None,
+    max_points: int = None,
+):
+    """
+    Endpoint untuk mendapatkan data plot t-SNE dari galeri.
+    Tanpa parameter, semua titik dikembalikan (labels, x, y) seperti sebelumnya.
+    - lod: 'points', 'subjects' (agregat per subjek), atau 'auto'
+    - x_min/x_max/y_min/y_max: viewport; max_points: batas jumlah titik (disampel)
+    - format: 'json' atau 'columnar' (label sebagai indeks, koordinat dibulatkan)
+    Respons memakai ETag berdasarkan versi galeri dan koordinat t-SNE; kirim If-None-Match untuk 304.
+    """
+    if lod not in LOD_CHOICES:
+        raise HTTPException(status_code=400, detail=f"lod harus salah satu dari {LOD_CHOICES}.")
+    if response_format not in FORMAT_CHOICES:
+        raise HTTPException(status_code=400, detail=f"format harus salah satu dari {FORMAT_CHOICES}.")
+    if max_points is not None and max_points <= 0:
+        raise HTTPException(status_code=400, detail="max_points harus lebih besar dari 0.")
+
+    plot_index = _get_plot_index()
+    if plot_index is None:
+        raise HTTPException(status_code=500, detail="Data plot tidak tersedia.")
+
+    # Isi respons hanya bergantung pada versi galeri, koordinat t-SNE, dan query.
+    # ETag lemah (W/): byte respons berbeda jika GZipMiddleware mengompresnya, tetapi isinya sama.
+    opaque_tag = f'"{plot_index.etag}"'
+    headers = {"ETag": f"W/{opaque_tag}", "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match", "")
+    # Perbandingan lemah (RFC 9110): abaikan prefiks W/ pada tag dari klien
+    client_tags = [tag.strip() for tag in if_none_match.split(",")]
+    client_tags = [tag[2:] if tag.startswith("W/") else tag for tag in client_tags]
+    if opaque_tag in client_tags or "*" in client_tags:
+        return Response(status_code=304, headers=headers)
+
+    bounds = (x_min, x_max, y_min, y_max)
+    return JSONResponse(content=plot_index.query(lod=lod, bounds=bounds, max_points=max_points, fmt=response_format), headers=headers)
+
+@app.get("/workers")
+async def get_worker_stats():
+    """Endpoint untuk melihat utilisasi setiap worker inferensi."""
+    if worker_pool is None:
+        return {"mode": "in-process", "num_workers": 0, "workers": []}
+    return {"mode": "worker-pool", **worker_pool.stats()}
 
 @app.get("/", include_in_schema=False)
 async def root():
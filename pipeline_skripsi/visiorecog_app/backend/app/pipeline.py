@@ -21,17 +21,19 @@ from pathlib import Path
 import os
 import glob
 import uuid
-from scipy.spatial.distance import cosine
 from typing import Union
 from sklearn.manifold import TSNE
 
 # Impor dari modul lokal kita
 from . import config
+from .iqa import IQAEngine
+from .gallery_exclusions import apply_gallery_exclusions
+from .detection import FaceDetection
+from .gallery_knn import GalleryKNNClassifier
 
 # Coba impor pustaka pihak ketiga dan berikan pesan error jika gagal
 try:
     from gfpgan import GFPGANer
-    import pyiqa
     from deepface import DeepFace
     from sklearn.neighbors import KNeighborsClassifier
     from sklearn.svm import SVC
@@ -46,33 +48,130 @@ from sklearn.metrics import accuracy_score, precision_recall_fscore_support, con
 
 import hashlib
 
+def generate_gallery_hash() -> str:
+    """Menghasilkan hash unik berdasarkan file dan waktu modifikasi di galeri."""
+    gallery_files = sorted(glob.glob(os.path.join(config.GALLERY_DIR, '*.jpg')) + glob.glob(os.path.join(config.GALLERY_DIR, '*.png')))
+    # Versi jalur embedding ikut di-hash agar cache dibangun ulang saat cara embedding berubah
+    manifest = [config.EMBEDDING_VERSION]
+    for file_path in gallery_files:
+        mod_time = os.path.getmtime(file_path)
+        manifest.append(f"{file_path}|{mod_time}")
+    
+    return hashlib.sha256("".join(manifest).encode()).hexdigest()
+
+def load_cached_gallery_features() -> Union[list, None]:
+    """Memuat fitur galeri dari cache jika hash-nya masih cocok, selain itu None."""
+    try:
+        with open(config.GALLERY_CACHE_PATH, 'rb') as f:
+            cached_data = pickle.load(f)
+        
+        if cached_data.get('hash') == generate_gallery_hash():
+            print("Memuat fitur galeri dari cache...")
+            return cached_data['features']
+        print("Cache galeri tidak valid.")
+    except (FileNotFoundError, EOFError, KeyError):
+        print("Cache galeri tidak ditemukan atau rusak.")
+    return None
+
+def build_gallery_matrix(features: list) -> np.ndarray:
+    """Menumpuk embedding galeri menjadi satu matriks float32 (n_gambar x dimensi)."""
+    if not features:
+        return np.zeros((0, 0), dtype=np.float32)
+    return np.asarray([item['embedding'] for item in features], dtype=np.float32)
+
+def compute_gallery_version(features: list, embeddings: np.ndarray) -> str:
+    """Versi isi galeri yang sedang dipakai (label, path, dan embedding), mis. untuk ETag."""
+    digest = hashlib.sha256(np.ascontiguousarray(embeddings).tobytes())
+    for item in features:
+        digest.update(f"{item['subject_id']}|{item['image_path']}\n".encode())
+    return digest.hexdigest()[:16]
+
+def calculate_tsne(embeddings: np.ndarray, labels: list) -> dict:
+    print("Menghitung proyeksi t-SNE untuk galeri...")
+    if len(embeddings) == 0:
+        return {"labels": [], "x": [], "y": []}
+
+    # Pastikan perplexity lebih kecil dari jumlah sampel
+    perplexity_value = min(30, len(embeddings) - 1)
+    if perplexity_value <= 0:
+        print("Tidak cukup data untuk menghitung t-SNE.")
+        return {"labels": [], "x": [], "y": []}
+
+    tsne = TSNE(n_components=2, perplexity=perplexity_value, random_state=42, n_iter=300)
+    tsne_projections = tsne.fit_transform(embeddings)
+
+    return {
+        "labels": labels,
+        "x": tsne_projections[:, 0].tolist(),
+        "y": tsne_projections[:, 1].tolist()
+    }
+
+def load_torch_models(device: torch.device) -> dict:
+    """
+    Memuat model berbasis torch (GFPGAN dan metrik IQA). Dipisah dari pipeline agar
+    InferenceWorkerPool bisa memuatnya sekali lalu membagikan bobotnya ke semua worker.
+    """
+    print("Memuat model GFPGAN...")
+    if not config.GFPGAN_WEIGHTS_PATH.is_file():
+        raise FileNotFoundError(f"File bobot GFPGAN tidak ditemukan di: {config.GFPGAN_WEIGHTS_PATH}")
+    # Konversi Path object ke string, karena GFPGANer mengharapkan string
+    restorer = GFPGANer(model_path=str(config.GFPGAN_WEIGHTS_PATH), upscale=2, arch='clean', channel_multiplier=2, bg_upsampler=None, device=device)
+    return {'gfpgan_restorer': restorer, 'iqa_engine': IQAEngine(device)}
+
+def load_knn_params(source_dir: Path = config.MODELS_DIR) -> Union[dict, None]:
+    """
+    Parameter KNN hasil train_models.py tanpa data latihnya, untuk GalleryKNNClassifier.
+    None jika model tidak ada atau metriknya bukan euclidean (tidak bisa dilayani dari galeri).
+    """
+    try:
+        with open(source_dir / 'knn_model.pkl', 'rb') as f: knn = pickle.load(f)
+    except (FileNotFoundError, OSError):
+        return None
+    if getattr(knn, 'effective_metric_', knn.metric) != 'euclidean':
+        print(f"PERINGATAN: Metrik KNN '{knn.metric}' tidak didukung dari galeri bersama; KNN dimuat per worker.")
+        return None
+    return {'n_neighbors': knn.n_neighbors, 'weights': knn.weights}
+
 class FaceRecognitionPipeline:
-    def __init__(self):
+    def __init__(self, gallery: tuple = None, shared_models: dict = None, knn_params: dict = None):
+        """
+        `gallery` opsional berupa (metadata_galeri, matriks_embedding) yang sudah dimuat
+        proses lain, mis. matriks di shared memory milik InferenceWorkerPool.
+        `shared_models` opsional berupa hasil load_torch_models() yang bobotnya sudah
+        berada di shared memory; jika None, model torch dimuat di proses ini.
+        `knn_params` opsional berupa hasil load_knn_params(): KNN dilayani langsung dari
+        matriks galeri (GalleryKNNClassifier) dan knn_model.pkl tidak dimuat.
+        """
         self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
         print(f"Pipeline diinisialisasi pada device: {self.device}")
 
-        self.gfpgan_restorer = self._load_gfpgan()
-        self.brisque_assessor = pyiqa.create_metric('brisque', device=self.device)
-        self.niqe_assessor = pyiqa.create_metric('niqe', device=self.device)
-        self.knn_model, self.svm_model, self.label_encoder = self._load_classifiers(source_dir=config.MODELS_DIR)
+        torch_models = shared_models if shared_models is not None else load_torch_models(self.device)
+        self.gfpgan_restorer = torch_models['gfpgan_restorer']
+        self.iqa_engine = torch_models['iqa_engine']
+        self.knn_model, self.svm_model, self.label_encoder = self._load_classifiers(source_dir=config.MODELS_DIR, load_knn=knn_params is None)
         
-        self.gallery_features = self._load_or_build_gallery_features()
-        self.tsne_results = self._calculate_tsne() # Hitung t-SNE saat startup
+        if gallery is None:
+            self.gallery_features = apply_gallery_exclusions(self._load_or_build_gallery_features(), config.GALLERY_EXCLUDE_PATH)
+            self.gallery_embeddings = build_gallery_matrix(self.gallery_features)
+            self.tsne_results = self._calculate_tsne() # Hitung t-SNE saat startup
+        else:
+            # Galeri milik proses lain (read-only); t-SNE juga dihitung di sana
+            self.gallery_features, self.gallery_embeddings = gallery
+            self.tsne_results = None
+        self.gallery_version = compute_gallery_version(self.gallery_features, self.gallery_embeddings)
+        self._gallery_norms = np.linalg.norm(self.gallery_embeddings, axis=1) if len(self.gallery_embeddings) else np.zeros(0, dtype=np.float32)
+        if knn_params is not None and self.label_encoder is not None:
+            class_index = {label: index for index, label in enumerate(self.label_encoder.classes_)}
+            codes = [class_index.get(item['subject_id'], -1) for item in self.gallery_features]
+            self.knn_model = GalleryKNNClassifier(self.gallery_embeddings, codes, len(class_index), **knn_params)
 
         print("Melakukan pemanasan model DeepFace...")
         # Pastikan model di-load dengan benar saat startup
-        DeepFace.represent(np.zeros((112, 112, 3), dtype=np.uint8), model_name=config.DEEPFACE_MODEL_NAME, enforce_detection=False)
+        DeepFace.represent(np.zeros((112, 112, 3), dtype=np.uint8), model_name=config.DEEPFACE_MODEL_NAME, enforce_detection=False, detector_backend='skip')
         print("Pipeline siap digunakan.")
 
     def _generate_gallery_hash(self) -> str:
-        """Menghasilkan hash unik berdasarkan file dan waktu modifikasi di galeri."""
-        gallery_files = sorted(glob.glob(os.path.join(config.GALLERY_DIR, '*.jpg')) + glob.glob(os.path.join(config.GALLERY_DIR, '*.png')))
-        manifest = []
-        for file_path in gallery_files:
-            mod_time = os.path.getmtime(file_path)
-            manifest.append(f"{file_path}|{mod_time}")
-        
-        return hashlib.sha256("".join(manifest).encode()).hexdigest()
+        return generate_gallery_hash()
 
     def _get_embedding_from_cropped(self, image_array: np.ndarray) -> Union[list, None]:
         """Mendapatkan embedding langsung dari gambar yang diasumsikan sudah di-crop."""
@@ -90,19 +189,9 @@ class FaceRecognitionPipeline:
 
     def _load_or_build_gallery_features(self) -> list:
         """Memuat fitur galeri dari cache jika valid, atau membangunnya kembali."""
-        current_hash = self._generate_gallery_hash()
-        
-        try:
-            with open(config.GALLERY_CACHE_PATH, 'rb') as f:
-                cached_data = pickle.load(f)
-            
-            if cached_data.get('hash') == current_hash:
-                print("Memuat fitur galeri dari cache...")
-                return cached_data['features']
-            else:
-                print("Cache galeri tidak valid.")
-        except (FileNotFoundError, EOFError, KeyError):
-            print("Cache galeri tidak ditemukan atau rusak.")
+        features = load_cached_gallery_features()
+        if features is not None:
+            return features
 
         # Jika cache tidak ada, tidak valid, atau rusak, bangun kembali
         print("Membangun ulang fitur galeri...")
@@ -110,7 +199,7 @@ class FaceRecognitionPipeline:
         
         # Simpan fitur baru beserta hash-nya ke cache
         with open(config.GALLERY_CACHE_PATH, 'wb') as f:
-            pickle.dump({'hash': current_hash, 'features': features}, f)
+            pickle.dump({'hash': generate_gallery_hash(), 'features': features}, f)
             print(f"Cache galeri berhasil disimpan di {config.GALLERY_CACHE_PATH}")
             
         return features
@@ -144,7 +233,7 @@ class FaceRecognitionPipeline:
 
                 # Coba ekstrak wajah
                 # Pastikan fungsi ini mengembalikan None jika wajah tidak ketemu, bukan error.
-                embedding, _ = self.get_embedding_and_landmarks(img)
+                embedding, _ = self.get_embedding_and_landmarks(img, use_pyramid=False)
                 
                 # LOGIKA PENYIMPANAN YANG KETAT
                 # Hanya simpan jika embedding berhasil diisi BARU (bukan None, bukan kosong)
@@ -167,15 +256,21 @@ class FaceRecognitionPipeline:
         print(f"Selesai. Total {len(features)} wajah valid berhasil disimpan.")
         return features
         
+    def _cosine_distances(self, embedding: list) -> np.ndarray:
+        """Jarak cosine embedding ke seluruh galeri sekaligus (0 = identik, 2 = berlawanan)."""
+        query = np.asarray(embedding, dtype=np.float32)
+        denom = self._gallery_norms * np.linalg.norm(query)
+        similarities = (self.gallery_embeddings @ query) / np.maximum(denom, 1e-12)
+        return 1.0 - similarities
+
     def _get_cosine_prediction(self, embedding: list) -> str:
         """Mencari satu prediksi terbaik berdasarkan Cosine Similarity."""
         if not self.gallery_features:
             return "N/A"
         
-        distances = [{'subject_id': item['subject_id'], 'distance': cosine(embedding, item['embedding'])} for item in self.gallery_features]
         # Cari item dengan distance terkecil
-        best_match = min(distances, key=lambda x: x['distance'])
-        return best_match['subject_id']
+        best_index = int(np.argmin(self._cosine_distances(embedding)))
+        return self.gallery_features[best_index]['subject_id']
 
     def _calculate_metrics(self, y_true, y_pred, labels):
         """Menghitung metrik evaluasi dari list ground truth dan prediksi."""
@@ -298,35 +393,15 @@ class FaceRecognitionPipeline:
         return convert_to_native_python_types(final_report)
         
     def _calculate_tsne(self):
-        print("Menghitung proyeksi t-SNE untuk galeri...")
-        if not self.gallery_features:
-            return {"labels": [], "x": [], "y": []}
-
-        embeddings = np.array([item['embedding'] for item in self.gallery_features])
         labels = [item['subject_id'] for item in self.gallery_features]
-
-        # Pastikan perplexity lebih kecil dari jumlah sampel
-        perplexity_value = min(30, len(embeddings) - 1)
-        if perplexity_value <= 0:
-            print("Tidak cukup data untuk menghitung t-SNE.")
-            return {"labels": [], "x": [], "y": []}
-
-        tsne = TSNE(n_components=2, perplexity=perplexity_value, random_state=42, n_iter=300)
-        tsne_projections = tsne.fit_transform(embeddings)
-
-        return {
-            "labels": labels,
-            "x": tsne_projections[:, 0].tolist(),
-            "y": tsne_projections[:, 1].tolist()
-        }
+        return calculate_tsne(self.gallery_embeddings, labels)
 
     def _transform_probe_embedding(self, probe_embedding):
         if not self.gallery_features:
             return None, None
 
         # Gabungkan embedding galeri dan probe
-        gallery_embeddings = np.array([item['embedding'] for item in self.gallery_features])
-        all_embeddings = np.vstack([gallery_embeddings, probe_embedding])
+        all_embeddings = np.vstack([self.gallery_embeddings, np.asarray(probe_embedding, dtype=np.float32)])
         
         perplexity_value = min(30, len(all_embeddings) - 1)
         if perplexity_value <= 0: return None, None
@@ -337,22 +412,18 @@ class FaceRecognitionPipeline:
         probe_coords = projections[-1]
         return probe_coords[0].tolist(), probe_coords[1].tolist()
 
-    def _load_gfpgan(self) -> GFPGANer:
-        print("Memuat model GFPGAN...")
-        if not config.GFPGAN_WEIGHTS_PATH.is_file():
-            raise FileNotFoundError(f"File bobot GFPGAN tidak ditemukan di: {config.GFPGAN_WEIGHTS_PATH}")
-        # Konversi Path object ke string, karena GFPGANer mengharapkan string
-        return GFPGANer(model_path=str(config.GFPGAN_WEIGHTS_PATH), upscale=2, arch='clean', channel_multiplier=2, bg_upsampler=None, device=self.device)
-
-    def _load_classifiers(self, source_dir=config.MODELS_DIR) -> tuple:
+    def _load_classifiers(self, source_dir=config.MODELS_DIR, load_knn: bool = True) -> tuple:
         """
         Memuat model KNN, SVM, dan LabelEncoder.
         Parameter source_dir menentukan folder asal (models atau models_evaluation).
+        load_knn=False melewati knn_model.pkl (KNN dilayani dari galeri bersama).
         """
         print(f"Memuat classifiers dari: {source_dir}...")
         try:
             # Perhatikan: Kita menggunakan source_dir, bukan config.MODELS_DIR langsung
-            with open(source_dir / 'knn_model.pkl', 'rb') as f: knn = pickle.load(f)
+            knn = None
+            if load_knn:
+                with open(source_dir / 'knn_model.pkl', 'rb') as f: knn = pickle.load(f)
             with open(source_dir / 'svm_model.pkl', 'rb') as f: svm = pickle.load(f)
             with open(source_dir / 'label_encoder.pkl', 'rb') as f: le = pickle.load(f)
             print("Classifiers berhasil dimuat.")
@@ -369,31 +440,28 @@ class FaceRecognitionPipeline:
             subject_id = Path(file_path).stem.split('_')[0]
             img = cv2.imdecode(np.fromfile(file_path, np.uint8), cv2.IMREAD_COLOR)
             if img is not None:
-                embedding, _ = self.get_embedding_and_landmarks(img)
+                embedding, _ = self.get_embedding_and_landmarks(img, use_pyramid=False)
                 if embedding:
                     features.append({'subject_id': subject_id, 'embedding': embedding, 'image_path': file_path})
         print(f"Fitur galeri berhasil dibuat. Ditemukan {len(features)} gambar.")
         return features
 
-    def get_embedding_and_landmarks(self, image_array: np.ndarray) -> (Union[list, None], Union[dict, None]):
-        try:
-            # Simpan ukuran gambar original untuk referensi landmarks
-            original_height, original_width = image_array.shape[:2]
-            
-            # Step 1: Ekstrak wajah dan landmarks menggunakan retinaface
-            # Fungsi ini TIDAK menerima model_name, tugasnya hanya deteksi.
-            face_objs = DeepFace.extract_faces(
-                img_path=image_array,
-                detector_backend='retinaface',
-                enforce_detection=False,
-                align=True # Align penting untuk embedding yang konsisten
-            )
-            
-            if not face_objs:
-                return None, None
-
-            face_obj = face_objs[0]
-            
+    def _run_retinaface(self, image_array: np.ndarray) -> list:
+        """Menjalankan RetinaFace (lewat DeepFace) dan mengembalikan list FaceDetection."""
+        # Simpan ukuran gambar original untuk referensi landmarks
+        original_height, original_width = image_array.shape[:2]
+        
+        # Ekstrak wajah dan landmarks menggunakan retinaface
+        # Fungsi ini TIDAK menerima model_name, tugasnya hanya deteksi.
+        face_objs = DeepFace.extract_faces(
+            img_path=image_array,
+            detector_backend='retinaface',
+            enforce_detection=False,
+            align=True # Align penting untuk embedding yang konsisten
+        )
+
+        detections = []
+        for face_obj in face_objs or []:
             # Ambil data facial area (termasuk landmarks)
             facial_area = face_obj['facial_area']
             
@@ -401,35 +469,131 @@ class FaceRecognitionPipeline:
             # Koordinat landmarks dari retinaface mengacu pada ukuran gambar input (image_array)
             facial_area['image_width'] = original_width
             facial_area['image_height'] = original_height
-            
-            print(f"Landmarks reference size: {original_width}x{original_height}")
-            print(f"Sample landmark (left_eye): {facial_area.get('left_eye', 'N/A')}")
-            
-            # Step 2: Dapatkan embedding dari wajah yang sudah di-crop dan di-align
-            # Wajah yang sudah diproses ada di key 'face'
+            detections.append(FaceDetection(facial_area, face_obj.get('confidence', 0.0), face=face_obj['face']))
+        return detections
+
+    def detect_faces(self, image_array: np.ndarray, use_pyramid: bool = True) -> list:
+        """
+        Deteksi semua wajah pada piramida gambar yang diperkecil: mulai dari sisi terpanjang
+        DETECTION_MAX_SIDE, naik 2x hanya jika tidak ada wajah, paling banyak
+        DETECTION_PYRAMID_LEVELS level. Resolusi penuh hanya dipakai jika gambar sudah
+        tidak lebih besar dari level tersebut; gambar besar tanpa wajah menghasilkan [].
+
+        Deteksi resolusi penuh memakai wajah ter-align dari DeepFace (jalur yang sama dengan
+        classifier & notebook ekstraksi). Hanya deteksi dari level yang diperkecil yang kotak &
+        landmark-nya dipetakan balik lalu di-crop dengan FaceDetection.crop_aligned dari piksel
+        resolusi penuh. use_pyramid=False selalu mendeteksi pada resolusi penuh (dipakai
+        saat membangun galeri agar embedding galeri tidak bergantung ukuran gambar).
+        """
+        height, width = image_array.shape[:2]
+        longest_side = max(height, width)
+        max_side = config.DETECTION_MAX_SIDE if use_pyramid else 0
+
+        try:
+            detections, scale = [], 1.0
+            for level in range(max(1, config.DETECTION_PYRAMID_LEVELS)):
+                side = max_side * 2 ** level
+                if not max_side or side >= longest_side:
+                    # Gambar sudah cukup kecil: deteksi pada resolusi penuh seperti biasa
+                    detections, scale = self._run_retinaface(image_array), 1.0
+                    break
+                scale = side / longest_side
+                resized = cv2.resize(image_array, (max(1, round(width * scale)), max(1, round(height * scale))), interpolation=cv2.INTER_AREA)
+                # Confidence 0 berarti DeepFace tidak menemukan wajah (mengembalikan seluruh gambar)
+                detections = [d for d in self._run_retinaface(resized) if d.confidence > 0]
+                if detections:
+                    break
+
+            if scale == 1.0:
+                return detections
+            full_res = []
+            for detection in detections:
+                detection = detection.rebase((0, 0), 1.0 / scale, (width, height))
+                detection.face = detection.crop_aligned(image_array)
+                full_res.append(detection)
+            return full_res
+        except Exception as e:
+            print(f"Error saat deteksi wajah: {e}")
+            return []
+
+    def detect_face(self, image_array: np.ndarray, use_pyramid: bool = True) -> Union[FaceDetection, None]:
+        """Deteksi wajah pertama pada gambar."""
+        detections = self.detect_faces(image_array, use_pyramid=use_pyramid)
+        if not detections:
+            return None
+
+        facial_area = detections[0].facial_area
+        print(f"Landmarks reference size: {facial_area['image_width']}x{facial_area['image_height']}")
+        print(f"Sample landmark (left_eye): {facial_area.get('left_eye', 'N/A')}")
+        return detections[0]
+
+    def embed_face(self, face: np.ndarray) -> Union[list, None]:
+        """
+        Mendapatkan embedding dari wajah yang sudah di-crop dan di-align.
+        detector_backend='skip' karena deteksi & alignment sudah dilakukan; tanpa ini
+        DeepFace menjalankan detektor default (opencv) lagi pada crop tersebut.
+        """
+        if face.dtype != np.uint8:
+            # Wajah dari DeepFace.extract_faces / crop_aligned berformat RGB float 0-1;
+            # represent dengan 'skip' mengharapkan gambar BGR uint8 seperti hasil baca file.
+            face = np.clip(face[:, :, ::-1] * 255.0, 0, 255).astype(np.uint8)
+        try:
             embedding_obj = DeepFace.represent(
-                img_path=face_obj['face'],
+                img_path=face,
                 model_name=config.DEEPFACE_MODEL_NAME,
-                enforce_detection=False
+                enforce_detection=False,
+                detector_backend='skip'
             )
-            
-            embedding = embedding_obj[0]['embedding']
+            return embedding_obj[0]['embedding']
+        except Exception as e:
+            print(f"Error saat ekstraksi embedding: {e}")
+            return None
 
-            return embedding, facial_area
+    def get_embedding_and_landmarks(self, image_array: np.ndarray, use_pyramid: bool = True) -> (Union[list, None], Union[dict, None]):
+        embedding, detection = self.get_embedding_and_detection(image_array, use_pyramid=use_pyramid)
+        if detection is None:
+            return None, None
+        return embedding, detection.landmarks()
 
-        except Exception as e:
-            print(f"Error saat ekstraksi embedding/landmarks: {e}")
+    def get_embedding_and_detection(self, image_array: np.ndarray, use_pyramid: bool = True) -> (Union[list, None], Union[FaceDetection, None]):
+        """Deteksi + embedding; FaceDetection dikembalikan agar bisa dipakai ulang."""
+        detection = self.detect_face(image_array, use_pyramid=use_pyramid)
+        if detection is None:
             return None, None
+        # Wajah yang sudah di-crop & di-align ada di detection.face
+        return self.embed_face(detection.face), detection
 
-    def get_iqa_scores(self, image_array: np.ndarray) -> Union[dict, None]:
-        if image_array is None or image_array.size == 0: return None
-        try:
-            img_rgb = cv2.cvtColor(image_array, cv2.COLOR_BGR2RGB)
-            img_tensor = torch.from_numpy(img_rgb).permute(2, 0, 1).unsqueeze(0) / 255.0
-            brisque_score = self.brisque_assessor(img_tensor.to(self.device)).item()
-            niqe_score = self.niqe_assessor(img_tensor.to(self.device)).item()
-            return {'brisque': round(brisque_score, 2), 'niqe': round(niqe_score, 2)}
-        except Exception: return None
+    def get_embedding_from_detection(self, image_array: np.ndarray, detection: Union[FaceDetection, None], reference_embedding: list = None) -> (Union[list, None], Union[dict, None]):
+        """
+        Embedding untuk gambar dengan geometri yang sama (mis. hasil restorasi GFPGAN)
+        menggunakan kotak & transformasi dari deteksi sebelumnya. Deteksi ulang hanya
+        dilakukan jika cek kepercayaan gagal (lihat REUSE_DETECTION_* di config).
+        `reference_embedding` adalah embedding wajah asli untuk memeriksa crop restorasi.
+        """
+        if detection is None or not detection.is_reusable_for(image_array):
+            print("Deteksi tidak dapat dipakai ulang, menjalankan RetinaFace kembali...")
+            return self.get_embedding_and_landmarks(image_array)
+
+        face = detection.crop_aligned(image_array)
+        embedding = self.embed_face(face)
+        if embedding is None:
+            return None, None
+
+        if reference_embedding is not None:
+            a = np.asarray(embedding, dtype=np.float32)
+            b = np.asarray(reference_embedding, dtype=np.float32)
+            similarity = float(a @ b / max(np.linalg.norm(a) * np.linalg.norm(b), 1e-12))
+            if similarity < config.REUSE_DETECTION_MIN_SIMILARITY:
+                print(f"Crop restorasi tidak konsisten (similarity {similarity:.2f}), menjalankan RetinaFace kembali...")
+                return self.get_embedding_and_landmarks(image_array)
+        return embedding, detection.landmarks()
+
+    def get_iqa_scores(self, image_array: np.ndarray, box: tuple = None, metrics: tuple = IQAEngine.METRICS) -> Union[dict, None]:
+        return self.iqa_engine.score(image_array, box=box, metrics=metrics)
+
+    def get_iqa_scores_batch(self, images: list, boxes: list = None, metrics: tuple = IQAEngine.METRICS, common_size: int = None) -> list:
+        """Versi batch get_iqa_scores untuk ekstraksi offline / rekognisi batch (lihat IQAEngine.score_batch)."""
+        return self.iqa_engine.score_batch(images, boxes=boxes, metrics=metrics, common_size=common_size)
 
     def get_predictions(self, embedding: list) -> dict:
         def get_top5_classifier(model, embedding):
@@ -442,9 +606,14 @@ class FaceRecognitionPipeline:
 
         # --- PERBAIKAN LOGIKA COSINE SIMILARITY ---
         distances = []
-        for item in self.gallery_features:
-            # Hitung jarak cosine (0 = identik, 2 = berlawanan)
-            dist = cosine(embedding, item['embedding'])
+        # Hitung jarak cosine ke seluruh galeri dalam satu operasi matriks,
+        # lalu hanya 5 teratas yang diproses lebih lanjut
+        all_distances = self._cosine_distances(embedding) if self.gallery_features else np.zeros(0)
+        k = min(5, len(all_distances))
+        nearest = np.argpartition(all_distances, k - 1)[:k] if k else []
+        for index in nearest:
+            item = self.gallery_features[index]
+            dist = float(all_distances[index])
             
             # --- RUMUS KEPERCAYAAN BARU ---
             # ArcFace biasanya menggunakan threshold 0.68 untuk verifikasi.
@@ -483,51 +652,71 @@ class FaceRecognitionPipeline:
 
         return {'knn': knn_top5, 'svm': svm_top5, 'cosine': cosine_top5}
 
-    def run_pipeline(self, image_path: Path) -> dict:
-        img_probe = cv2.imdecode(np.fromfile(str(image_path), np.uint8), cv2.IMREAD_COLOR)
-        if img_probe is None: return {"error": "Gagal membaca file gambar."}
-
-        # --- Tambahan: Pastikan gambar tidak terlalu kecil ---
+    def prepare_probe(self, img_probe: np.ndarray) -> (np.ndarray, float):
+        """Pastikan gambar tidak terlalu kecil. Mengembalikan gambar dan faktor skalanya."""
         MIN_WIDTH = 512
         h, w, _ = img_probe.shape
         if w < MIN_WIDTH:
             scale = MIN_WIDTH / w
             new_w = int(w * scale)
             new_h = int(h * scale)
-            img_probe = cv2.resize(img_probe, (new_w, new_h), interpolation=cv2.INTER_LANCZOS4)
-        # --- Akhir Tambahan ---
+            return cv2.resize(img_probe, (new_w, new_h), interpolation=cv2.INTER_LANCZOS4), scale
+        return img_probe, 1.0
+
+    def restore_face(self, img_probe: np.ndarray) -> Union[np.ndarray, None]:
+        """Restorasi GFPGAN; hasil di-resize ke ukuran asli agar geometri deteksi tetap berlaku."""
+        _, restored_faces, _ = self.gfpgan_restorer.enhance(img_probe, has_aligned=True, only_center_face=False)
+        if not restored_faces or restored_faces[0] is None:
+            return None
+        # Ambil dimensi gambar asli
+        original_height, original_width, _ = img_probe.shape
+        dsize = (original_width, original_height)
+
+        # Resize gambar restorasi agar sama dengan ukuran asli
+        return cv2.resize(restored_faces[0], dsize)
+
+    def run_pipeline(self, image_path: Path) -> dict:
+        img_probe = cv2.imdecode(np.fromfile(str(image_path), np.uint8), cv2.IMREAD_COLOR)
+        if img_probe is None: return {"error": "Gagal membaca file gambar."}
+        return self.run_pipeline_on_image(img_probe)
+
+    def run_pipeline_on_image(self, img_probe: np.ndarray) -> dict:
+        """Sama seperti run_pipeline, tetapi untuk gambar (BGR) yang sudah di-decode."""
+        img_probe, _ = self.prepare_probe(img_probe)
 
         results = {'pipeline_a': None, 'pipeline_b': None, 'probe_coords': None}
 
-        embedding_a, landmarks_a = self.get_embedding_and_landmarks(img_probe)
+        embedding_a, detection_a = self.get_embedding_and_detection(img_probe)
         if embedding_a:
             probe_x, probe_y = self._transform_probe_embedding(embedding_a)
             results['probe_coords'] = {'x': probe_x, 'y': probe_y}
             results['pipeline_a'] = {
-                'iqa': self.get_iqa_scores(img_probe),
+                'iqa': None,
                 'predictions': self.get_predictions(embedding_a),
-                'landmarks': landmarks_a
+                'landmarks': detection_a.landmarks()
             }
 
-        _, restored_faces, _ = self.gfpgan_restorer.enhance(img_probe, has_aligned=True, only_center_face=False)
-        if restored_faces and restored_faces[0] is not None:
-            # Ambil dimensi gambar asli
-            original_height, original_width, _ = img_probe.shape
-            dsize = (original_width, original_height)
-
-            # Resize gambar restorasi agar sama dengan ukuran asli
-            restored_face = cv2.resize(restored_faces[0], dsize)
-
-            embedding_b, landmarks_b = self.get_embedding_and_landmarks(restored_face)
+        restored_face = self.restore_face(img_probe)
+        if restored_face is not None:
+            # Geometri gambar restorasi sama dengan gambar asli, jadi deteksi dipakai ulang
+            embedding_b, landmarks_b = self.get_embedding_from_detection(restored_face, detection_a, reference_embedding=embedding_a)
             restored_filename = f"restored_{uuid.uuid4()}.png"
             cv2.imwrite(str(config.UPLOADS_DIR / restored_filename), restored_face)
 
             if embedding_b:
                 results['pipeline_b'] = {
-                    'iqa': self.get_iqa_scores(restored_face),
+                    'iqa': None,
                     'predictions': self.get_predictions(embedding_b),
                     'restored_image_url': f"/uploads/{restored_filename}",
                     'landmarks': landmarks_b
                 }
+
+        # IQA gambar asli & restorasi dihitung dalam satu batch (ukurannya sama)
+        iqa_images = {'pipeline_a': img_probe, 'pipeline_b': restored_face}
+        iqa_targets = [key for key in iqa_images if results[key]]
+        box = detection_a.box() if (config.IQA_ON_FACE_CROP and detection_a is not None) else None
+        iqa_scores = self.get_iqa_scores_batch([iqa_images[key] for key in iqa_targets], boxes=[box] * len(iqa_targets))
+        for key, scores in zip(iqa_targets, iqa_scores):
+            results[key]['iqa'] = scores
         
         return convert_to_native_python_types(results)
@@ -0,0 +1,46 @@
+import heapq
+import itertools
+
+
+def box_iou(box_a: tuple, box_b: tuple) -> float:
+    """Intersection-over-Union dua kotak (x1, y1, x2, y2)."""
+    ix1, iy1 = max(box_a[0], box_b[0]), max(box_a[1], box_b[1])
+    ix2, iy2 = min(box_a[2], box_b[2]), min(box_a[3], box_b[3])
+    inter = max(0, ix2 - ix1) * max(0, iy2 - iy1)
+    if inter == 0:
+        return 0.0
+    area_a = (box_a[2] - box_a[0]) * (box_a[3] - box_a[1])
+    area_b = (box_b[2] - box_b[0]) * (box_b[3] - box_b[1])
+    return inter / float(area_a + area_b - inter)
+
+
+class FaceTrack:
+    """Satu wajah yang diikuti antar frame beserta keyframe terbaiknya."""
+    def __init__(self, track_id: int, frame_index: int, box: tuple):
+        self.track_id = track_id
+        self.first_frame = frame_index
+        self.last_frame = frame_index
+        self.last_box = box
+        self.hits = 0
+        self.missed = 0
+        # Min-heap (-skor_kualitas, urutan, keyframe): elemen teratas adalah keyframe terburuk
+        self._keyframes = []
+        self._counter = itertools.count()
+
+    def update(self, frame_index: int, box: tuple):
+        self.last_frame = frame_index
+        self.last_box = box
+        self.hits += 1
+        self.missed = 0
+
+    def offer_keyframe(self, quality: float, keyframe: dict, max_keyframes: int):
+        """Simpan keyframe jika termasuk `max_keyframes` terbaik (skor kualitas kecil = lebih baik)."""
+        entry = (-quality, next(self._counter), keyframe)
+        if len(self._keyframes) < max_keyframes:
+            heapq.heappush(self._keyframes, entry)
+        elif entry[0] > self._keyframes[0][0]:
+            heapq.heapreplace(self._keyframes, entry)
+
+    def keyframes(self) -> list:
+        """Keyframe terurut dari kualitas terbaik."""
+        return [entry[2] for entry in sorted(self._keyframes, key=lambda e: -e[0])]
@@ -5,6 +5,7 @@ from sklearn.svm import SVC
 from sklearn.preprocessing import LabelEncoder
 from pathlib import Path
 import config # Pastikan config.py ada di folder yang sama
+from gallery_exclusions import apply_gallery_exclusions
 
 def train_models():
     print("--- Memulai Retraining Model (Spesifikasi Skripsi v6.4.3) ---")
@@ -21,6 +22,9 @@ def train_models():
         data = pickle.load(f)
         features = data['features']
 
+    # Keluarkan gambar yang ditandai audit_gallery.py (mis. duplikat)
+    features = apply_gallery_exclusions(features, config.GALLERY_EXCLUDE_PATH)
+
     if not features:
         print("Data galeri kosong. Mohon isi folder 'gallery' dengan foto wajah.")
         return
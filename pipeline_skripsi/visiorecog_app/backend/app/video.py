@@ -0,0 +1,211 @@
+import cv2
+import itertools
+import numpy as np
+import uuid
+from pathlib import Path
+from typing import Union
+
+# Impor dari modul lokal kita
+from . import config
+from .detection import FaceDetection
+from .pipeline import FaceRecognitionPipeline, convert_to_native_python_types
+from .tracking import FaceTrack, box_iou
+
+
+class VideoProbeProcessor:
+    """
+    Mode probe video: decode klip secara streaming, lacak wajah antar frame dengan
+    asosiasi IoU, pilih keyframe terbaik per track berdasarkan BRISQUE/NIQE, lalu
+    jalankan restorasi & embedding hanya pada keyframe tersebut.
+    """
+    def __init__(self, pipeline: FaceRecognitionPipeline):
+        self.pipeline = pipeline
+
+    def process(self, video_path: Path) -> dict:
+        capture = cv2.VideoCapture(str(video_path))
+        if not capture.isOpened():
+            return {"error": "Gagal membuka file video."}
+
+        fps = capture.get(cv2.CAP_PROP_FPS) or 0.0
+        active_tracks, finished_tracks = [], []
+        track_ids = itertools.count(1)
+        frame_index = -1
+        sampled_frames = 0
+
+        try:
+            while True:
+                # grab() melewati konversi warna/penyalinan frame (retrieve). Pada codec antar-frame
+                # (H.264, dll.) backend FFmpeg tetap men-decode setiap frame di grab(), jadi
+                # VIDEO_FRAME_STRIDE mengurangi biaya deteksi/IQA, bukan biaya decode.
+                if not capture.grab():
+                    break
+                frame_index += 1
+                if frame_index % config.VIDEO_FRAME_STRIDE != 0:
+                    continue
+                if config.VIDEO_MAX_SAMPLED_FRAMES and sampled_frames >= config.VIDEO_MAX_SAMPLED_FRAMES:
+                    break
+                ok, frame = capture.retrieve()
+                if not ok or frame is None:
+                    continue
+                sampled_frames += 1
+
+                detections = [d for d in self.pipeline.detect_faces(frame)
+                              if d.confidence >= config.VIDEO_MIN_DETECTION_CONFIDENCE]
+                matched = self._associate(active_tracks, detections)
+
+                candidates = []
+                for detection, track in matched:
+                    if track is None:
+                        track = FaceTrack(next(track_ids), frame_index, detection.box())
+                        active_tracks.append(track)
+                    track.update(frame_index, detection.box())
+                    crop, offset = self._crop_with_margin(frame, detection)
+                    if crop.size:
+                        candidates.append((track, detection, crop, offset))
+                self._score_keyframes(candidates, frame_index, fps)
+
+                # Track yang terlalu lama tidak terlihat dianggap selesai
+                still_active = []
+                for track in active_tracks:
+                    if track.last_frame != frame_index:
+                        track.missed += 1
+                    if track.missed > config.VIDEO_TRACK_MAX_MISSED:
+                        finished_tracks.append(track)
+                    else:
+                        still_active.append(track)
+                active_tracks = still_active
+        finally:
+            capture.release()
+
+        finished_tracks.extend(active_tracks)
+        tracks = [t for t in finished_tracks if t.hits >= config.VIDEO_MIN_TRACK_HITS]
+        print(f"Video: {frame_index + 1} frame, {sampled_frames} disampel, {len(tracks)} track valid.")
+
+        results = {
+            'summary': {
+                'total_frames': frame_index + 1,
+                'sampled_frames': sampled_frames,
+                'fps': fps,
+                'track_count': len(tracks),
+            },
+            'tracks': [self._recognize_track(track) for track in sorted(tracks, key=lambda t: t.first_frame)],
+        }
+        return convert_to_native_python_types(results)
+
+    def _associate(self, tracks: list, detections: list) -> list:
+        """Asosiasi greedy berdasarkan IoU; deteksi tanpa pasangan mendapat track None."""
+        candidates = []
+        for d_idx, detection in enumerate(detections):
+            for t_idx, track in enumerate(tracks):
+                iou = box_iou(detection.box(), track.last_box)
+                if iou >= config.VIDEO_TRACK_IOU_THRESHOLD:
+                    candidates.append((iou, d_idx, t_idx))
+
+        used_detections, used_tracks, matched = set(), set(), []
+        for iou, d_idx, t_idx in sorted(candidates, reverse=True):
+            if d_idx in used_detections or t_idx in used_tracks:
+                continue
+            used_detections.add(d_idx)
+            used_tracks.add(t_idx)
+            matched.append((detections[d_idx], tracks[t_idx]))
+
+        for d_idx, detection in enumerate(detections):
+            if d_idx not in used_detections:
+                matched.append((detection, None))
+        return matched
+
+    def _crop_with_margin(self, frame: np.ndarray, detection: FaceDetection) -> (np.ndarray, tuple):
+        x1, y1, x2, y2 = detection.box()
+        margin_x = int((x2 - x1) * config.VIDEO_CROP_MARGIN)
+        margin_y = int((y2 - y1) * config.VIDEO_CROP_MARGIN)
+        height, width = frame.shape[:2]
+        cx1, cy1 = max(0, x1 - margin_x), max(0, y1 - margin_y)
+        cx2, cy2 = min(width, x2 + margin_x), min(height, y2 + margin_y)
+        # copy() agar crop tidak menahan seluruh frame di memori
+        return frame[cy1:cy2, cx1:cx2].copy(), (cx1, cy1)
+
+    def _score_keyframes(self, candidates: list, frame_index: int, fps: float):
+        """Nilai semua crop wajah dari satu frame dalam satu batch IQA, lalu tawarkan ke track-nya."""
+        if not candidates:
+            return
+        scores = self.pipeline.get_iqa_scores_batch([crop for _, _, crop, _ in candidates], common_size=config.VIDEO_IQA_SIZE)
+        for (track, detection, crop, offset), iqa in zip(candidates, scores):
+            if iqa is None:
+                continue
+            # BRISQUE dan NIQE: semakin kecil semakin baik
+            quality = iqa['brisque'] + iqa['niqe']
+            track.offer_keyframe(quality, {
+                'frame_index': frame_index,
+                'timestamp': (frame_index / fps) if fps else None,
+                'iqa': iqa,
+                'crop': crop,
+                'offset': offset,
+                'detection': detection,
+            }, config.VIDEO_KEYFRAMES_PER_TRACK)
+
+    def _recognize_keyframe(self, keyframe: dict) -> Union[dict, None]:
+        """Restorasi + embedding satu keyframe, memakai ulang deteksi dari frame."""
+        img_probe, scale = self.pipeline.prepare_probe(keyframe['crop'])
+        height, width = img_probe.shape[:2]
+        detection = keyframe['detection'].rebase(keyframe['offset'], scale, (width, height))
+
+        embedding, source = None, 'restored'
+        restored_face = self.pipeline.restore_face(img_probe)
+        if restored_face is not None:
+            embedding, _ = self.pipeline.get_embedding_from_detection(restored_face, detection)
+        if not embedding:
+            # Embedding wajah asli hanya dihitung jika restorasi gagal
+            embedding, source = self.pipeline.embed_face(detection.face), 'original'
+
+        if not embedding:
+            return None
+        return {'source': source, 'predictions': self.pipeline.get_predictions(embedding)}
+
+    def _recognize_track(self, track: FaceTrack) -> dict:
+        keyframe_results = []
+        for keyframe in track.keyframes():
+            recognized = self._recognize_keyframe(keyframe)
+            keyframe_results.append({
+                'frame_index': keyframe['frame_index'],
+                'timestamp': keyframe['timestamp'],
+                'iqa': keyframe['iqa'],
+                'source': recognized['source'] if recognized else None,
+                'predictions': recognized['predictions'] if recognized else None,
+            })
+
+        best_keyframe_url = None
+        keyframes = track.keyframes()
+        if keyframes:
+            best_filename = f"keyframe_{uuid.uuid4()}.png"
+            cv2.imwrite(str(config.UPLOADS_DIR / best_filename), keyframes[0]['crop'])
+            best_keyframe_url = f"/uploads/{best_filename}"
+
+        predictions = self._aggregate_predictions([k['predictions'] for k in keyframe_results if k['predictions']])
+        return {
+            'track_id': track.track_id,
+            'first_frame': track.first_frame,
+            'last_frame': track.last_frame,
+            'detections': track.hits,
+            'best_keyframe_url': best_keyframe_url,
+            'keyframes': keyframe_results,
+            'predictions': predictions,
+            'identity': {method: (top[0]['label'] if top else None) for method, top in predictions.items()},
+        }
+
+    def _aggregate_predictions(self, predictions_list: list) -> dict:
+        """Rata-rata confidence per label dari semua keyframe, per metode (knn, svm, cosine)."""
+        aggregated = {}
+        if not predictions_list:
+            return aggregated
+        for method in ('knn', 'svm', 'cosine'):
+            totals = {}
+            for predictions in predictions_list:
+                # Cosine bisa memuat beberapa gambar dari subjek yang sama; ambil yang terbaik
+                best_per_label = {}
+                for item in predictions.get(method, []):
+                    best_per_label[item['label']] = max(best_per_label.get(item['label'], 0.0), item['confidence'])
+                for label, confidence in best_per_label.items():
+                    totals[label] = totals.get(label, 0.0) + confidence
+            ranked = sorted(totals.items(), key=lambda kv: kv[1], reverse=True)[:5]
+            aggregated[method] = [{'label': label, 'confidence': total / len(predictions_list)} for label, total in ranked]
+        return aggregated
@@ -0,0 +1,470 @@
+import itertools
+import os
+import queue
+import threading
+import time
+import types
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from multiprocessing import shared_memory
+
+import numpy as np
+import torch
+import torch.multiprocessing as torch_mp
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Impor dari modul lokal kita
+from . import config
+from .gallery_exclusions import apply_gallery_exclusions
+from .pipeline import (FaceRecognitionPipeline, build_gallery_matrix, calculate_tsne,
+                       compute_gallery_version, load_cached_gallery_features, load_knn_params,
+                       load_torch_models)
+
+# Variabel lingkungan yang membatasi jumlah thread BLAS/OpenMP/TensorFlow per worker,
+# supaya N worker x T thread tidak melebihi jumlah core.
+_THREAD_ENV_VARS = ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS',
+                    'TF_NUM_INTRAOP_THREADS', 'TF_NUM_INTEROP_THREADS')
+
+
+class WorkerCrashedError(RuntimeError):
+    """Worker berhenti (crash atau dihentikan) sebelum tugasnya selesai."""
+
+
+class WorkerTimeoutError(RuntimeError):
+    """Tugas tidak selesai dalam batas waktu; worker yang memegangnya dijalankan ulang."""
+
+
+def _build_gallery_cache(shared_models: dict):
+    """Dijalankan di proses terpisah: membangun pipeline sekali agar cache galeri ditulis."""
+    FaceRecognitionPipeline(shared_models=shared_models)
+
+
+def _attach_array(spec: tuple) -> (shared_memory.SharedMemory, np.ndarray):
+    """Membuka segmen shared memory dan membungkusnya sebagai array tanpa menyalin."""
+    name, shape, dtype = spec
+    segment = shared_memory.SharedMemory(name=name)
+    return segment, np.ndarray(shape, dtype=dtype, buffer=segment.buf)
+
+
+def _share_torch_models(obj, depth: int = 0):
+    """
+    Pindahkan bobot semua nn.Module di dalam `obj` (dict/objek pembungkus seperti GFPGANer
+    dan IQAEngine) ke shared memory. Saat worker spawn dimulai, torch.multiprocessing
+    mengirim bobot tersebut sebagai handle, bukan salinan.
+    """
+    if isinstance(obj, torch.nn.Module):
+        obj.share_memory()
+    elif depth < 4 and not isinstance(obj, (type, types.ModuleType)):
+        if isinstance(obj, dict):
+            children = obj.values()
+        else:
+            children = vars(obj).values() if hasattr(obj, '__dict__') else ()
+        for child in children:
+            _share_torch_models(child, depth + 1)
+
+
+def _acquire_instance_lock(path):
+    """Kunci file eksklusif; gagal jika pool lain (proses server lain) sudah berjalan."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    handle = open(path, 'a+')
+    try:
+        if fcntl is not None:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            handle.seek(0)
+            msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        handle.close()
+        raise RuntimeError(
+            f"Pool worker inferensi sudah berjalan di proses lain (kunci {path}). "
+            "Jalankan server dengan satu proses (mis. tanpa `uvicorn --workers N`)."
+        )
+    return handle
+
+
+def _release_instance_lock(handle):
+    if fcntl is not None:
+        fcntl.flock(handle, fcntl.LOCK_UN)
+    else:
+        handle.seek(0)
+        msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+    handle.close()
+
+
+def _worker_main(worker_id: int, task_queue, result_queue, gallery_spec: tuple, gallery_metadata: list, slot_names: list, shared_models: dict, knn_params: dict, busy_seconds, task_counts):
+    """Loop utama proses worker inferensi."""
+    from .video import VideoProbeProcessor
+
+    # Matriks embedding galeri dibaca langsung dari segmen bersama (read-only)
+    gallery_segment, gallery_embeddings = _attach_array(gallery_spec)
+    gallery_embeddings.flags.writeable = False
+    slots = [shared_memory.SharedMemory(name=name) for name in slot_names]
+
+    # Model torch (GFPGAN, IQA) memakai bobot bersama milik pool dan KNN dilayani dari matriks
+    # galeri bersama; DeepFace/TF (ArcFace + RetinaFace), SVM, dan LabelEncoder dimuat per worker
+    pipeline = FaceRecognitionPipeline(gallery=(gallery_metadata, gallery_embeddings), shared_models=shared_models, knn_params=knn_params)
+    video_processor = VideoProbeProcessor(pipeline)
+    handlers = {
+        'recognize': pipeline.run_pipeline_on_image,
+        'evaluate': pipeline.run_evaluation,
+        'video': video_processor.process,
+    }
+    result_queue.put((None, 'ready', None))
+
+    try:
+        while True:
+            task = task_queue.get()
+            if task is None:
+                break
+            task_id, task_name, image_spec, args = task
+            started = time.perf_counter()
+            adhoc_segment, image, call_args = None, None, None
+            try:
+                call_args = list(args)
+                if image_spec is not None:
+                    slot_index, shape, dtype = image_spec
+                    if isinstance(slot_index, str):
+                        # Gambar terlalu besar untuk slot: segmen sementara milik front-end
+                        adhoc_segment, image = _attach_array((slot_index, shape, dtype))
+                    else:
+                        image = np.ndarray(shape, dtype=dtype, buffer=slots[slot_index].buf)
+                    call_args.insert(0, image)
+                result = handlers[task_name](*call_args)
+                result_queue.put((task_id, 'ok', result))
+            except Exception as e:
+                print(f"Worker {worker_id}: error saat memproses '{task_name}': {e}")
+                result_queue.put((task_id, 'error', str(e)))
+            finally:
+                # Lepas semua view ke buffer sebelum segmen ditutup
+                image = call_args = None
+                if adhoc_segment is not None:
+                    adhoc_segment.close()
+                busy_seconds[worker_id] += time.perf_counter() - started
+                task_counts[worker_id] += 1
+    finally:
+        for segment in slots:
+            segment.close()
+        gallery_segment.close()
+
+
+class InferenceWorkerPool:
+    """
+    Pool proses inferensi berukuran tetap. Front-end HTTP hanya men-decode gambar dan
+    menuliskannya ke slot shared memory; worker membaca piksel langsung dari slot
+    tersebut (tanpa pickling array). Embedding galeri dan bobot model torch (GFPGAN,
+    BRISQUE/NIQE) disimpan sekali di shared memory dan dipakai bersama semua worker;
+    KNN dilayani langsung dari matriks galeri tersebut.
+
+    Yang tetap dimuat per worker (memori naik linear dengan jumlah worker): runtime
+    TensorFlow beserta ArcFace dan RetinaFace dari DeepFace (kira-kira 0,5-1 GB per worker,
+    tergantung versi TF), model SVM (termasuk support vector-nya), dan LabelEncoder.
+
+    Setiap worker punya antrean tugasnya sendiri sehingga pool tahu tugas mana yang
+    dipegang worker mana. Worker yang mati dijalankan ulang dan tugas-tugasnya digagalkan
+    dengan WorkerCrashedError, sehingga request tidak menggantung dan slot tidak bocor.
+    """
+    def __init__(self, num_workers: int = config.INFERENCE_WORKERS):
+        self.num_workers = max(1, num_workers)
+        # Satu pool per mesin: proses server kedua (mis. uvicorn --workers 2) ditolak
+        self._lock_handle = _acquire_instance_lock(config.WORKER_POOL_LOCK_PATH)
+        try:
+            self._start()
+        except Exception:
+            self.shutdown()
+            raise
+
+    def _start(self):
+        self._context = torch_mp.get_context('spawn')  # aman untuk torch/TensorFlow
+        self._futures = {}  # task_id -> (future, release, worker_id)
+        self._pending = [set() for _ in range(self.num_workers)]
+        self._lock = threading.Lock()
+        self._ready_changed = threading.Condition(self._lock)
+        self._ready_workers = set()
+        self._closing = threading.Event()
+        self._task_ids = itertools.count()
+        self._busy_seconds = self._context.Array('d', self.num_workers)
+        self._task_counts = self._context.Array('l', self.num_workers)
+        self._restarts = [0] * self.num_workers
+        self._processes = [None] * self.num_workers
+        self._task_queues = [None] * self.num_workers
+        self._result_queues = [None] * self.num_workers
+        self._dispatchers = [None] * self.num_workers
+        self._slots, self._gallery_segment, self._monitor = [], None, None
+        self._started_at = time.time()
+
+        # Model torch dimuat sekali di proses ini lalu dibagikan ke worker lewat shared memory
+        device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+        self._shared_models = load_torch_models(device)
+        _share_torch_models(self._shared_models)
+        # Hanya parameter KNN yang dikirim ke worker; data latihnya adalah matriks galeri bersama
+        self._knn_params = load_knn_params()
+
+        self.gallery_features, self._gallery_segment, self._gallery_spec = self._load_shared_gallery()
+        self.gallery_version = compute_gallery_version(self.gallery_features, self._gallery_array)
+        self.tsne_results = calculate_tsne(self._gallery_array, [item['subject_id'] for item in self.gallery_features])
+
+        # Slot gambar bersama; jumlah slot membatasi request yang sedang diproses/antri
+        self._slots = [shared_memory.SharedMemory(create=True, size=config.WORKER_SLOT_BYTES)
+                       for _ in range(self.num_workers * config.WORKER_SLOTS_PER_WORKER)]
+        self._free_slots = queue.Queue()
+        for index in range(len(self._slots)):
+            self._free_slots.put(index)
+
+        self._threads_per_worker = str(max(1, (os.cpu_count() or 1) // self.num_workers))
+        for worker_id in range(self.num_workers):
+            self._spawn_worker(worker_id)
+
+        print(f"Menunggu {self.num_workers} worker inferensi siap...")
+        with self._ready_changed:
+            while len(self._ready_workers) < self.num_workers:
+                dead = [worker_id for worker_id, process in enumerate(self._processes) if not process.is_alive()]
+                if dead:
+                    raise RuntimeError(f"Worker {dead} berhenti saat startup. Periksa error di atas.")
+                self._ready_changed.wait(timeout=config.WORKER_MONITOR_INTERVAL)
+        self._started_at = time.time()
+
+        self._monitor = threading.Thread(target=self._monitor_workers, daemon=True)
+        self._monitor.start()
+        print("Semua worker inferensi siap.")
+
+    def _load_shared_gallery(self) -> tuple:
+        """Memuat galeri dari cache dan menyalin embedding-nya ke satu segmen shared memory."""
+        features = load_cached_gallery_features()
+        if features is None:
+            # Cache perlu dibangun dengan DeepFace; lakukan sekali di proses terpisah
+            print("Membangun cache galeri di proses terpisah...")
+            builder = self._context.Process(target=_build_gallery_cache, args=(self._shared_models,))
+            builder.start()
+            builder.join()
+            features = load_cached_gallery_features()
+            if features is None:
+                raise RuntimeError("Gagal membangun cache galeri.")
+
+        features = apply_gallery_exclusions(features, config.GALLERY_EXCLUDE_PATH)
+        matrix = build_gallery_matrix(features)
+        segment = shared_memory.SharedMemory(create=True, size=max(1, matrix.nbytes))
+        self._gallery_array = np.ndarray(matrix.shape, dtype=matrix.dtype, buffer=segment.buf)
+        self._gallery_array[:] = matrix
+        # Worker hanya butuh metadata kecil; embedding dibaca dari segmen bersama
+        metadata = [{'subject_id': item['subject_id'], 'image_path': item['image_path']} for item in features]
+        return metadata, segment, (segment.name, matrix.shape, matrix.dtype.str)
+
+    @staticmethod
+    def _start_with_env(process, env: dict):
+        """Proses spawn mewarisi os.environ saat start(); atur sementara lalu kembalikan."""
+        previous = {name: os.environ.get(name) for name in env}
+        os.environ.update(env)
+        try:
+            process.start()
+        finally:
+            for name, value in previous.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+
+    def _spawn_worker(self, worker_id: int):
+        task_queue, result_queue = self._context.Queue(), self._context.Queue()
+        process = self._context.Process(
+            target=_worker_main,
+            args=(worker_id, task_queue, result_queue, self._gallery_spec, self.gallery_features,
+                  [slot.name for slot in self._slots], self._shared_models, self._knn_params,
+                  self._busy_seconds, self._task_counts),
+            daemon=True,
+        )
+        with self._lock:
+            self._processes[worker_id] = process
+            self._task_queues[worker_id] = task_queue
+            self._result_queues[worker_id] = result_queue
+        self._start_with_env(process, {name: self._threads_per_worker for name in _THREAD_ENV_VARS})
+
+        dispatcher = threading.Thread(target=self._dispatch_results, args=(worker_id, result_queue), daemon=True)
+        self._dispatchers[worker_id] = dispatcher
+        dispatcher.start()
+
+    @staticmethod
+    def _resolve(future: Future, result=None, error: Exception = None):
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def _dispatch_results(self, worker_id: int, result_queue):
+        """Satu thread per worker: meneruskan hasil dari antrean hasil worker ke Future-nya."""
+        while True:
+            try:
+                item = result_queue.get()
+            except (EOFError, OSError):
+                break
+            if item is None:
+                break
+            task_id, status, payload = item
+            if status == 'ready':
+                with self._ready_changed:
+                    self._ready_workers.add(worker_id)
+                    self._ready_changed.notify_all()
+                continue
+            with self._lock:
+                entry = self._futures.pop(task_id, None)
+                self._pending[worker_id].discard(task_id)
+            if entry is None:
+                continue  # Sudah digagalkan (timeout atau worker dianggap mati)
+            future, release, _ = entry
+            release()
+            if status == 'ok':
+                self._resolve(future, result=payload)
+            else:
+                self._resolve(future, error=RuntimeError(payload))
+
+    def _monitor_workers(self):
+        """Periksa worker secara berkala; worker yang mati dijalankan ulang."""
+        while not self._closing.wait(config.WORKER_MONITOR_INTERVAL):
+            for worker_id in range(self.num_workers):
+                if not self._processes[worker_id].is_alive() and not self._closing.is_set():
+                    self._restart_worker(worker_id)
+
+    def _restart_worker(self, worker_id: int):
+        process = self._processes[worker_id]
+        process.join(timeout=1)
+        print(f"Worker {worker_id} (pid {process.pid}) berhenti dengan exitcode {process.exitcode}; menjalankan ulang...")
+
+        # Teruskan hasil yang sempat dikirim sebelum worker mati, lalu hentikan dispatcher-nya
+        self._result_queues[worker_id].put(None)
+        self._dispatchers[worker_id].join(timeout=5)
+
+        with self._lock:
+            orphaned = [self._futures.pop(task_id) for task_id in self._pending[worker_id] if task_id in self._futures]
+            self._pending[worker_id] = set()
+            self._ready_workers.discard(worker_id)
+        for future, release, _ in orphaned:
+            release()
+            self._resolve(future, error=WorkerCrashedError(f"Worker {worker_id} berhenti sebelum tugas selesai."))
+
+        self._restarts[worker_id] += 1
+        self._spawn_worker(worker_id)
+
+    def submit(self, task_name: str, image: np.ndarray = None, *args) -> Future:
+        """
+        Mengirim tugas ke worker dengan antrean terpendek (worker yang siap didahulukan).
+        Jika `image` diberikan, piksel disalin ke slot shared memory (memblokir sampai ada
+        slot kosong). Mengembalikan Future berisi hasilnya.
+        """
+        task_id = next(self._task_ids)
+        future = Future()
+        future.set_running_or_notify_cancel()  # Tugas tidak bisa dibatalkan setelah dikirim
+        image_spec, release = None, (lambda: None)
+
+        if image is not None:
+            image = np.ascontiguousarray(image)
+            if image.nbytes <= config.WORKER_SLOT_BYTES:
+                slot_index = self._free_slots.get()
+                np.ndarray(image.shape, dtype=image.dtype, buffer=self._slots[slot_index].buf)[:] = image
+                image_spec = (slot_index, image.shape, image.dtype.str)
+                release = lambda: self._free_slots.put(slot_index)
+            else:
+                segment = shared_memory.SharedMemory(create=True, size=image.nbytes)
+                np.ndarray(image.shape, dtype=image.dtype, buffer=segment.buf)[:] = image
+                image_spec = (segment.name, image.shape, image.dtype.str)
+
+                def release():
+                    segment.close()
+                    segment.unlink()
+
+        with self._lock:
+            worker_id = min(range(self.num_workers),
+                            key=lambda wid: (wid not in self._ready_workers, len(self._pending[wid])))
+            self._futures[task_id] = (future, release, worker_id)
+            self._pending[worker_id].add(task_id)
+            self._task_queues[worker_id].put((task_id, task_name, image_spec, args))
+        return future
+
+    def call(self, task_name: str, image: np.ndarray = None, *args, timeout: float = None):
+        """
+        Versi blocking dari submit(); cocok dipanggil lewat run_in_threadpool.
+        `timeout` default config.WORKER_TASK_TIMEOUT (0 = tanpa batas). Jika terlewati,
+        worker yang memegang tugas dihentikan (lalu dijalankan ulang oleh monitor) dan
+        WorkerTimeoutError dilempar.
+        """
+        timeout = config.WORKER_TASK_TIMEOUT if timeout is None else timeout
+        future = self.submit(task_name, image, *args)
+        try:
+            return future.result(timeout=timeout or None)
+        except FutureTimeoutError:
+            self._abort(future)
+            raise WorkerTimeoutError(f"Tugas '{task_name}' tidak selesai dalam {timeout} detik.") from None
+
+    def _abort(self, future: Future):
+        """Hentikan worker yang masih memegang `future`; monitor akan menggagalkan sisanya."""
+        with self._lock:
+            holders = [worker_id for f, _, worker_id in self._futures.values() if f is future]
+            process = self._processes[holders[0]] if holders else None
+        if process is not None and process.is_alive():
+            print(f"Worker {holders[0]} melewati batas waktu; dihentikan.")
+            process.terminate()
+
+    def stats(self) -> dict:
+        """Utilisasi per worker: porsi waktu sejak start yang dipakai untuk memproses tugas."""
+        elapsed = max(time.time() - self._started_at, 1e-9)
+        workers = []
+        with self._lock:
+            for worker_id, process in enumerate(self._processes):
+                busy = self._busy_seconds[worker_id]
+                workers.append({
+                    'worker_id': worker_id,
+                    'pid': process.pid,
+                    'alive': process.is_alive(),
+                    'ready': worker_id in self._ready_workers,
+                    'pending': len(self._pending[worker_id]),
+                    'restarts': self._restarts[worker_id],
+                    'tasks': self._task_counts[worker_id],
+                    'busy_seconds': round(busy, 2),
+                    'utilization': round(min(busy / elapsed, 1.0), 4),
+                })
+        return {
+            'num_workers': self.num_workers,
+            'free_slots': self._free_slots.qsize(),
+            'total_slots': len(self._slots),
+            'uptime_seconds': round(elapsed, 2),
+            'workers': workers,
+        }
+
+    def shutdown(self):
+        closing = getattr(self, '_closing', None)
+        if closing is not None:
+            closing.set()
+            if self._monitor is not None:
+                self._monitor.join(timeout=5)
+            for task_queue in self._task_queues:
+                if task_queue is not None:
+                    task_queue.put(None)
+            for process in self._processes:
+                if process is None:
+                    continue
+                process.join(timeout=10)
+                if process.is_alive():
+                    process.terminate()
+                    process.join(timeout=5)
+            for result_queue in self._result_queues:
+                if result_queue is not None:
+                    result_queue.put(None)
+
+            with self._lock:
+                orphaned = list(self._futures.values())
+                self._futures.clear()
+            for future, release, _ in orphaned:
+                release()
+                self._resolve(future, error=WorkerCrashedError("Pool worker dihentikan."))
+
+            self._gallery_array = None
+            segments = self._slots + ([self._gallery_segment] if self._gallery_segment is not None else [])
+            for segment in segments:
+                segment.close()
+                segment.unlink()
+
+        if self._lock_handle is not None:
+            _release_instance_lock(self._lock_handle)
+            self._lock_handle = None
@@ -0,0 +1,9 @@
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+# Paket app diimpor sebagai `app.*`; skrip seperti audit_gallery.py memakai `import config`
+for path in (BACKEND_DIR, BACKEND_DIR / 'app'):
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
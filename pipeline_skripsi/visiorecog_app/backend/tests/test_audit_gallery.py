@@ -0,0 +1,75 @@
+import numpy as np
+
+from audit_gallery import duplicate_exclusions, find_outliers, scan_pairs
+
+
+def normalized(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def test_scan_pairs_matches_brute_force_across_blocks():
+    rng = np.random.default_rng(0)
+    embeddings = normalized(rng.normal(size=(23, 8)))
+    embeddings[7] = embeddings[3]    # duplikat subjek sama
+    embeddings[20] = embeddings[11]  # duplikat beda subjek
+    codes = np.arange(23) % 4
+    codes[7] = codes[3]
+
+    roots, examples, duplicate_total, cross_pairs, cross_total = scan_pairs(
+        embeddings, codes, block_size=5, duplicate_threshold=0.999, cross_threshold=0.3, max_pairs=5)
+
+    sims = embeddings @ embeddings.T
+    i, j = np.triu_indices(len(embeddings), k=1)
+    expected_cross = [(sims[a, b], a, b) for a, b in zip(i, j) if sims[a, b] >= 0.3 and codes[a] != codes[b]]
+    assert duplicate_total == 2
+    assert sorted((a, b) for a, b, _ in examples) == [(3, 7), (11, 20)]
+    assert roots[7] == 3 and roots[20] == 11 and roots[5] == 5
+    assert cross_total == len(expected_cross)
+    assert [(a, b) for _, a, b in cross_pairs] == [(a, b) for _, a, b in sorted(expected_cross, reverse=True)[:5]]
+
+
+def test_scan_pairs_groups_many_identical_vectors_without_storing_pairs():
+    rng = np.random.default_rng(1)
+    base = normalized(rng.normal(size=(4, 16)))
+    assignment = rng.integers(0, 4, size=60)
+    embeddings = base[assignment]
+    codes = np.zeros(60, dtype=np.int64)
+
+    roots, examples, duplicate_total, _, _ = scan_pairs(
+        embeddings, codes, block_size=7, duplicate_threshold=0.999, cross_threshold=0.99, max_pairs=3)
+
+    # Akar setiap gambar adalah indeks terkecil dengan vektor yang sama
+    first_index = {group: int(np.argmax(assignment == group)) for group in np.unique(assignment)}
+    assert roots.tolist() == [first_index[group] for group in assignment]
+    assert len(examples) == 3
+    assert duplicate_total == sum(count * (count - 1) // 2 for count in np.bincount(assignment))
+
+
+def test_scan_pairs_accepts_zero_max_pairs():
+    embeddings = normalized([[1, 0], [1, 0], [0, 1]])
+    _, examples, duplicate_total, cross_pairs, cross_total = scan_pairs(
+        embeddings, np.array([0, 1, 1]), block_size=2, duplicate_threshold=0.999, cross_threshold=0.5, max_pairs=0)
+    assert (examples, duplicate_total, cross_pairs, cross_total) == ([], 1, [], 1)
+
+
+def test_find_outliers_flags_mislabeled_sample_in_any_block_size():
+    embeddings = normalized([[1, 0.1], [1, -0.1], [1, 0], [0.1, 1], [-0.1, 1], [0, 1]])
+    codes = np.array([0, 0, 0, 1, 1, 0])  # sampel terakhir berlabel 0 tetapi mirip subjek 1
+
+    outliers = find_outliers(embeddings, codes, outlier_threshold=0.3)
+
+    assert [idx for idx, _, _, _ in outliers] == [5]
+    assert outliers[0][2] == 1
+    assert find_outliers(embeddings, codes, outlier_threshold=0.3, block_size=4) == outliers
+
+
+def test_duplicate_exclusions_only_cleans_same_subject_groups():
+    roots = np.array([0, 0, 0, 3, 3, 5, 5])
+    codes = np.array([0, 0, 0, 1, 2, 3, 3])
+    paths = [f'/gallery/{idx}_img.jpg' for idx in range(7)]
+
+    excluded, conflicts = duplicate_exclusions(roots, paths, codes)
+
+    assert excluded == ['1_img.jpg', '2_img.jpg', '6_img.jpg']
+    assert conflicts == [[3, 4]]
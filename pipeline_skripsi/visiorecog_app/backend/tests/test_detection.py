@@ -0,0 +1,52 @@
+import numpy as np
+
+from app.detection import FaceDetection
+
+
+def make_detection(left_eye=(20, 30), right_eye=(30, 30), face=None):
+    area = {'x': 10, 'y': 20, 'w': 30, 'h': 40, 'left_eye': left_eye, 'right_eye': right_eye,
+            'image_width': 100, 'image_height': 80}
+    return FaceDetection(area, 0.99, face=face)
+
+
+def test_rebase_shifts_and_scales_box_and_landmarks():
+    face = np.zeros((4, 4, 3), dtype=np.uint8)
+    rebased = make_detection(face=face).rebase((5, 10), 2.0, (200, 160))
+
+    area = rebased.facial_area
+    assert (area['x'], area['y'], area['w'], area['h']) == (10, 20, 60, 80)
+    assert area['left_eye'] == (30, 40)
+    assert area['right_eye'] == (50, 40)
+    assert rebased.image_size == (200, 160)
+    assert rebased.box() == (10, 20, 70, 100)
+    assert rebased.confidence == 0.99
+    assert rebased.face is face
+
+
+def test_rebase_back_projects_pyramid_level():
+    # Deteksi pada gambar yang diperkecil 4x dipetakan balik ke resolusi penuh
+    rebased = make_detection().rebase((0, 0), 4.0, (400, 320))
+    assert rebased.box() == (40, 80, 160, 240)
+    assert rebased.crop_size == (120, 160)
+
+
+def test_crop_aligned_without_rotation_is_plain_crop():
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 256, size=(80, 100, 3), dtype=np.uint8)
+    crop = make_detection().crop_aligned(image)
+
+    # Format sama dengan wajah dari DeepFace.extract_faces: RGB, float 0-1
+    assert crop.dtype == np.float32
+    assert np.allclose(crop * 255.0, image[20:60, 10:40, ::-1])
+
+
+def test_alignment_does_not_depend_on_eye_order():
+    a = make_detection(left_eye=(20, 30), right_eye=(30, 34))
+    b = make_detection(left_eye=(30, 34), right_eye=(20, 30))
+    assert np.allclose(a.transform, b.transform)
+
+
+def test_is_reusable_for_checks_image_size():
+    detection = make_detection()
+    assert detection.is_reusable_for(np.zeros((80, 100, 3), dtype=np.uint8))
+    assert not detection.is_reusable_for(np.zeros((160, 200, 3), dtype=np.uint8))
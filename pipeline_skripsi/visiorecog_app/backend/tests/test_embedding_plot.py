@@ -0,0 +1,73 @@
+import numpy as np
+
+from app import config
+from app.embedding_plot import EmbeddingPlotIndex
+
+
+def make_index(n_subjects=4, per_subject=50):
+    rng = np.random.default_rng(0)
+    labels, xs, ys = [], [], []
+    for subject in range(n_subjects):
+        labels += [f's{subject}'] * per_subject
+        xs += (rng.normal(size=per_subject) + subject * 10).tolist()
+        ys += rng.normal(size=per_subject).tolist()
+    return EmbeddingPlotIndex({'labels': labels, 'x': xs, 'y': ys}, version='v1'), labels, xs, ys
+
+
+def test_points_without_parameters_returns_everything():
+    index, labels, xs, ys = make_index()
+    result = index.query()
+    assert result['returned_points'] == result['total_points'] == len(labels)
+    assert result['labels'] == labels
+    assert result['x'] == xs and result['y'] == ys
+
+
+def test_sample_covers_all_subjects_and_is_stable_when_zooming():
+    index, _, xs, _ = make_index()
+    full = index.query(max_points=20)
+    assert len(full['labels']) == 20
+    assert set(full['labels']) == {'s0', 's1', 's2', 's3'}
+
+    zoomed = index.query(bounds=(-5, 5, None, None), max_points=20)
+    assert all(-5 <= x <= 5 for x in zoomed['x'])
+    # Titik sampel tampilan penuh yang masih di dalam viewport tetap muncul setelah zoom
+    kept = {x for x in full['x'] if -5 <= x <= 5}
+    assert kept <= set(zoomed['x'])
+
+
+def test_subjects_lod_aggregates_per_subject():
+    index, labels, xs, ys = make_index()
+    result = index.query(lod='subjects')
+    assert result['labels'] == ['s0', 's1', 's2', 's3']
+    assert result['count'] == [50] * 4
+    assert np.allclose(result['x'][1], np.mean(xs[50:100]))
+    assert np.allclose(result['y'][1], np.mean(ys[50:100]))
+
+
+def test_auto_lod_switches_on_point_limit_and_zoom():
+    index, _, _, _ = make_index()
+    assert index.query(lod='auto', max_points=500)['lod'] == 'points'
+    assert index.query(lod='auto', max_points=100)['lod'] == 'subjects'
+    zoomed = index.query(lod='auto', bounds=(-5, 5, None, None), max_points=10)
+    assert zoomed['lod'] == 'points' and zoomed['returned_points'] == 10
+
+
+def test_columnar_format_round_trips_labels():
+    index, labels, xs, _ = make_index()
+    result = index.query(fmt='columnar')
+    assert [result['subjects'][code] for code in result['label_index']] == labels
+    assert result['x'] == np.round(xs, config.EMBEDDING_PLOT_DECIMALS).tolist()
+
+
+def test_columnar_subjects_use_label_index():
+    index, _, _, _ = make_index()
+    result = index.query(lod='subjects', fmt='columnar')
+    assert 'labels' not in result
+    assert [result['subjects'][code] for code in result['label_index']] == ['s0', 's1', 's2', 's3']
+
+
+def test_etag_changes_with_projection():
+    index, labels, xs, ys = make_index()
+    moved = EmbeddingPlotIndex({'labels': labels, 'x': xs, 'y': [y + 1.0 for y in ys]}, version='v1')
+    assert index.etag.startswith('v1-')
+    assert moved.etag != index.etag
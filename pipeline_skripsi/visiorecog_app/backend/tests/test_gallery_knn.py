@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+
+from app.gallery_knn import GalleryKNNClassifier
+
+
+EMBEDDINGS = np.array([[0, 0], [1, 0], [0, 3], [10, 10]], dtype=np.float32)
+
+
+def test_single_neighbor_gets_all_probability():
+    knn = GalleryKNNClassifier(EMBEDDINGS, [0, 1, 2, 2], n_classes=3, n_neighbors=1)
+    assert knn.predict_proba([[0.9, 0.1]]).tolist() == [[0.0, 1.0, 0.0]]
+
+
+def test_distance_weights_match_inverse_distance():
+    knn = GalleryKNNClassifier(EMBEDDINGS, [0, 1, 2, 2], n_classes=3, n_neighbors=3)
+    # Jarak dari (0, 1): 1 (kelas 0), sqrt(2) (kelas 1), 2 (kelas 2)
+    weights = np.array([1.0, 1 / np.sqrt(2), 0.5])
+    assert knn.predict_proba([[0, 1]])[0] == pytest.approx(weights / weights.sum())
+
+
+def test_zero_distance_neighbor_takes_all_weight():
+    knn = GalleryKNNClassifier(EMBEDDINGS, [0, 1, 2, 2], n_classes=3, n_neighbors=3)
+    assert knn.predict_proba([[1, 0]]).tolist() == [[0.0, 1.0, 0.0]]
+
+
+def test_rows_with_unknown_labels_are_ignored():
+    knn = GalleryKNNClassifier(EMBEDDINGS, [-1, 1, 2, 2], n_classes=3, n_neighbors=1)
+    assert knn.predict_proba([[0, 0]]).tolist() == [[0.0, 1.0, 0.0]]
@@ -0,0 +1,31 @@
+import pytest
+
+from app.tracking import FaceTrack, box_iou
+
+
+def test_box_iou():
+    assert box_iou((0, 0, 10, 10), (0, 0, 10, 10)) == 1.0
+    assert box_iou((0, 0, 10, 10), (5, 0, 15, 10)) == pytest.approx(1 / 3)
+    assert box_iou((0, 0, 10, 10), (10, 0, 20, 10)) == 0.0
+    assert box_iou((0, 0, 10, 10), (20, 20, 30, 30)) == 0.0
+
+
+def test_offer_keyframe_keeps_best_keyframes_in_order():
+    track = FaceTrack(1, 0, (0, 0, 10, 10))
+    for quality in (5.0, 1.0, 4.0, 2.0, 3.0):
+        track.offer_keyframe(quality, {'quality': quality}, max_keyframes=3)
+    assert [k['quality'] for k in track.keyframes()] == [1.0, 2.0, 3.0]
+
+
+def test_offer_keyframe_keeps_earlier_keyframe_on_tie():
+    track = FaceTrack(1, 0, (0, 0, 10, 10))
+    track.offer_keyframe(1.0, {'frame': 0}, max_keyframes=1)
+    track.offer_keyframe(1.0, {'frame': 5}, max_keyframes=1)
+    assert track.keyframes() == [{'frame': 0}]
+
+
+def test_update_resets_missed_counter():
+    track = FaceTrack(1, 0, (0, 0, 10, 10))
+    track.missed = 2
+    track.update(5, (1, 1, 11, 11))
+    assert (track.hits, track.missed, track.last_frame, track.last_box) == (1, 0, 5, (1, 1, 11, 11))